@@ -0,0 +1,161 @@
+import threading
+import time
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+CODIGOS_REPETIVEIS = {429, 500, 502, 503, 504}
+# Exceções de `google.api_core` equivalentes a esses códigos (comparadas pelo nome, para não importar a biblioteca aqui).
+ERROS_API_REPETIVEIS = {'ResourceExhausted', 'TooManyRequests', 'InternalServerError', 'BadGateway',
+                        'ServiceUnavailable', 'GatewayTimeout'}
+# Módulos cujas exceções são sempre de transporte. Várias delas herdam de `OSError` (`socket.gaierror`, `ssl.SSLError`,
+# `requests.RequestException`), então são conferidas antes dos erros de arquivo.
+MODULOS_REDE = {'socket', 'ssl', 'requests', 'urllib3', 'httpx', 'httpcore', 'aiohttp'}
+
+
+def codigo_http(erro: Exception):
+    """O código HTTP informado pela própria exceção (atributo `code` das exceções da API), ou `None`."""
+    codigo = getattr(erro, 'code', None)
+    return int(codigo) if isinstance(codigo, int) and not isinstance(codigo, bool) else None
+
+
+def _erro_de_rede(erro: Exception) -> bool:
+    if isinstance(erro, (ConnectionError, TimeoutError)):
+        return True
+    return any(classe.__module__.split('.')[0] in MODULOS_REDE for classe in type(erro).__mro__)
+
+
+def categorizar_erro(erro: Exception) -> str:
+    """Agrupa os erros de uma imagem: 'cota' (429), 'servidor' (5xx), 'requisicao' (4xx), 'rede', 'imagem' ou 'outro'.
+
+    Só o tipo e o código da exceção contam, nunca o texto (que pode trazer caminhos como 'IMG_5021.jpg').
+    Os tipos locais vêm primeiro: um erro de arquivo ou de imagem nunca vira erro da API. Entre eles, os de
+    transporte (que também podem ser `OSError`) são conferidos antes, para não virarem erro de imagem.
+    """
+    if _erro_de_rede(erro):
+        return 'rede'
+    if isinstance(erro, OSError) or type(erro).__name__ in ('UnidentifiedImageError', 'DecompressionBombError'):
+        return 'imagem'
+    codigo = codigo_http(erro)
+    if codigo is None and any(classe.__name__ in ERROS_API_REPETIVEIS for classe in type(erro).__mro__):
+        codigo = 429 if type(erro).__name__ in ('ResourceExhausted', 'TooManyRequests') else 503
+    if codigo == 429:
+        return 'cota'
+    if codigo is not None and 500 <= codigo < 600:
+        return 'servidor'
+    if codigo is not None and 400 <= codigo < 500:
+        return 'requisicao'
+    return 'outro'
+
+
+def erro_repetivel(erro: Exception) -> bool:
+    """Indica se o erro é de cota (429) ou do servidor (5xx) e vale uma nova tentativa. Erros locais nunca são repetidos."""
+    codigo = codigo_http(erro)
+    return categorizar_erro(erro) in ('cota', 'servidor') and (codigo is None or codigo in CODIGOS_REPETIVEIS)
+
+
+class ExtracaoCancelada(Exception):
+    """Lançada dentro do agendador quando o evento de cancelamento é acionado durante uma espera."""
+
+
+class LimitadorTaxa:
+    """Janela deslizante de 60s que limita quantas requisições podem começar por minuto."""
+
+    def __init__(self, max_por_minuto: int, janela: float = 60.0):
+        self.max_por_minuto = max_por_minuto
+        self.janela = janela
+        self._inicios = deque()
+        self._lock = threading.Lock()
+
+    def aguardar_vaga(self, cancelar=None):
+        if not self.max_por_minuto or self.max_por_minuto <= 0:
+            return
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                while self._inicios and agora - self._inicios[0] >= self.janela:
+                    self._inicios.popleft()
+                if len(self._inicios) < self.max_por_minuto:
+                    self._inicios.append(agora)
+                    return
+                espera = self.janela - (agora - self._inicios[0])
+            if cancelar is None:
+                time.sleep(max(espera, 0.01))
+            elif cancelar.wait(max(espera, 0.01)):
+                return
+
+
+class AgendadorExtracao:
+    """Mantém várias chamadas de OCR em andamento respeitando o limite de requisições por minuto.
+
+    `funcao` deve lançar exceção em caso de falha (e não devolver lista vazia), para que
+    erros 429/5xx possam ser repetidos com backoff exponencial.
+    Com `vaga_pela_funcao`, a vaga do limite por minuto não é tomada antes de cada chamada: `funcao(item, aguardar_vaga)`
+    chama `aguardar_vaga()` logo antes da requisição de verdade, então o que sai do cache não gasta vaga.
+    """
+
+    def __init__(self, funcao, max_simultaneas: int = 4, max_por_minuto: int = 60,
+                 max_tentativas: int = 4, espera_base: float = 2.0, espera_maxima: float = 60.0,
+                 vaga_pela_funcao: bool = False):
+        self.funcao = funcao
+        self.vaga_pela_funcao = vaga_pela_funcao
+        self.max_simultaneas = max(1, max_simultaneas)
+        self.limitador = LimitadorTaxa(max_por_minuto)
+        self.max_tentativas = max(1, max_tentativas)
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+
+    def _aguardar_vaga(self, cancelar=None):
+        self.limitador.aguardar_vaga(cancelar)
+        if cancelar is not None and cancelar.is_set():
+            raise ExtracaoCancelada()
+
+    def _executar_com_repeticao(self, item, cancelar=None):
+        tentativa = 0
+        while True:
+            tentativa += 1
+            try:
+                if self.vaga_pela_funcao:
+                    return self.funcao(item, lambda: self._aguardar_vaga(cancelar))
+                self._aguardar_vaga(cancelar)
+                return self.funcao(item)
+            except Exception as e:
+                if tentativa >= self.max_tentativas or not erro_repetivel(e):
+                    raise
+                espera = min(self.espera_maxima, self.espera_base * (2 ** (tentativa - 1)))
+                espera += random.uniform(0, espera / 2)
+                print(f"Tentativa {tentativa} falhou para '{item}': {e}. Repetindo em {espera:.1f}s...")
+                if cancelar is None:
+                    time.sleep(espera)
+                elif cancelar.wait(espera):
+                    raise ExtracaoCancelada()
+
+    def executar(self, itens, ao_concluir=None, cancelar=None) -> list:
+        """Processa todos os itens e devolve os resultados na mesma ordem da entrada.
+
+        `ao_concluir(indice, item, resultado, erro)` é chamado (na thread do agendador)
+        a cada item terminado, na ordem em que terminam.
+        Itens que falham definitivamente ficam com `None` na lista de resultados.
+        `cancelar` (um `threading.Event`) interrompe a execução: os itens que ainda não começaram são
+        descartados, as esperas de backoff terminam na hora e só as chamadas já em andamento são aguardadas,
+        sem gerar `ao_concluir`.
+        """
+        itens = list(itens)
+        resultados = [None] * len(itens)
+        if not itens:
+            return resultados
+
+        with ThreadPoolExecutor(max_workers=self.max_simultaneas) as executor:
+            futuros = {executor.submit(self._executar_com_repeticao, item, cancelar): i for i, item in enumerate(itens)}
+            for futuro in as_completed(futuros):
+                if cancelar is not None and cancelar.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+                i = futuros[futuro]
+                erro = futuro.exception()
+                if erro is None:
+                    resultados[i] = futuro.result()
+                if ao_concluir:
+                    ao_concluir(i, itens[i], resultados[i], erro)
+        return resultados
@@ -0,0 +1,215 @@
+import os
+import re
+import time
+from dataclasses import dataclass, field
+
+from agendador import AgendadorExtracao
+from ocr_chaves import (validar_formato_chave, _extrair_chaves_da_imagem_sem_tratamento, _extrair_varias_com_gemini,
+                        _medicao, MAX_REQUISICOES_SIMULTANEAS, MAX_REQUISICOES_POR_MINUTO)
+from decodificador_chaves import corrigir_chave
+from entrada_documentos import abrir_unidade
+
+
+PADRAO_CHAVE_NO_TEXTO = re.compile(r'[A-Z0-9]{5}(?:-[A-Z0-9]{5}){4}')
+
+
+@dataclass
+class ChaveLida:
+    chave: str
+    confianca: float
+
+
+@dataclass
+class ResultadoOCR:
+    """Resultado comum a todos os backends: chaves com confiança (0 a 1), tempo gasto e quem leu."""
+    imagem: str
+    backend: str
+    chaves: list = field(default_factory=list)
+    tempo: float = 0.0
+
+    def como_linhas(self) -> list:
+        """Converte para as linhas {'Imagem', 'Chave'} usadas pelo painel, pelo CLI e pelo registro."""
+        return [{'Imagem': self.imagem, 'Chave': lida.chave} for lida in self.chaves]
+
+    def tem_chave_confiavel(self, confianca_minima: float) -> bool:
+        return any(validar_formato_chave(lida.chave) and lida.confianca >= confianca_minima for lida in self.chaves)
+
+
+BACKENDS = {}
+
+
+def registrar_backend(nome: str):
+    """Decorador que registra uma classe de backend pelo nome usado em `BACKEND_OCR`."""
+    def registrar(classe):
+        classe.nome = nome
+        BACKENDS[nome] = classe
+        return classe
+    return registrar
+
+
+def criar_backend(nome: str, **opcoes):
+    if nome not in BACKENDS:
+        raise ValueError(f"Backend de OCR desconhecido: '{nome}'. Disponíveis: {', '.join(sorted(BACKENDS))}")
+    return BACKENDS[nome](**opcoes)
+
+
+class BackendOCR:
+    """Interface dos backends. Cada um implementa `ler`, que deve lançar exceção em caso de falha (o agendador decide se repete).
+
+    `extrair` e `extrair_varias` recebem as `metricas` da execução; por padrão, o tempo de `ler` conta como a etapa
+    'ocr_<nome>'. Os backends que medem as próprias etapas (gemini, cascata) sobrescrevem os dois.
+    """
+    nome = None
+
+    def ler(self, caminho_imagem: str) -> ResultadoOCR:
+        raise NotImplementedError
+
+    def extrair(self, caminho_imagem: str, metricas=None) -> ResultadoOCR:
+        medicao = _medicao(caminho_imagem, metricas)
+        medicao.origem = self.nome
+        with medicao.etapa(f"ocr_{self.nome}"):
+            return self.ler(caminho_imagem)
+
+    def extrair_varias(self, caminhos: list, ao_concluir=None, cancelar=None, metricas=None, **limites) -> list:
+        """Extrai várias imagens pelo `AgendadorExtracao` (`limites` substitui os da API, ex.: `max_por_minuto=0`).
+
+        `ao_concluir(indice, caminho, resultado, erro)` recebe o `ResultadoOCR` de cada imagem.
+        """
+        limites = {'max_simultaneas': MAX_REQUISICOES_SIMULTANEAS, 'max_por_minuto': MAX_REQUISICOES_POR_MINUTO, **limites}
+        agendador = AgendadorExtracao(lambda caminho: self.extrair(caminho, metricas), **limites)
+        return agendador.executar(caminhos, ao_concluir=ao_concluir, cancelar=cancelar)
+
+
+@registrar_backend('gemini')
+class BackendGemini(BackendOCR):
+    """A extração atual via API Gemini (com cache e pré-processamento). A API não informa confiança, então vale 1.0."""
+
+    def _resultado(self, caminho_imagem: str, linhas: list, tempo: float = 0.0) -> ResultadoOCR:
+        return ResultadoOCR(os.path.basename(caminho_imagem), self.nome,
+                            [ChaveLida(linha['Chave'], 1.0) for linha in linhas], tempo)
+
+    def extrair(self, caminho_imagem: str, metricas=None) -> ResultadoOCR:
+        inicio = time.perf_counter()
+        linhas = _extrair_chaves_da_imagem_sem_tratamento(caminho_imagem, metricas)
+        return self._resultado(caminho_imagem, linhas, time.perf_counter() - inicio)
+
+    def extrair_varias(self, caminhos: list, ao_concluir=None, cancelar=None, metricas=None, **limites) -> list:
+        """Usa os lotes e os limites da API de `_extrair_varias_com_gemini` (ignora `limites`)."""
+        def ao_concluir_linhas(indice, caminho, linhas, erro):
+            if ao_concluir:
+                ao_concluir(indice, caminho, None if linhas is None else self._resultado(caminho, linhas), erro)
+
+        linhas = _extrair_varias_com_gemini(list(caminhos), ao_concluir_linhas, cancelar, metricas)
+        return [self._resultado(caminho, linhas_imagem) for caminho, linhas_imagem in zip(caminhos, linhas)]
+
+
+@registrar_backend('tesseract')
+class BackendTesseract(BackendOCR):
+    """OCR local com Tesseract (requer `pytesseract` e o executável do Tesseract instalados).
+
+    A confiança de cada chave é a menor confiança, entre as palavras da linha em que ela foi encontrada.
+    """
+
+    def __init__(self, lado_maximo: int = 2000):
+        self.lado_maximo = lado_maximo
+
+    def ler(self, caminho_imagem: str) -> ResultadoOCR:
+        import pytesseract
+        from PIL import ImageOps
+
+        inicio = time.perf_counter()
+        img = ImageOps.exif_transpose(abrir_unidade(caminho_imagem)).convert('L')
+        if max(img.size) > self.lado_maximo:
+            img.thumbnail((self.lado_maximo, self.lado_maximo))
+        dados = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+
+        linhas = {}
+        for texto, confianca, bloco, paragrafo, linha in zip(dados['text'], dados['conf'], dados['block_num'],
+                                                              dados['par_num'], dados['line_num']):
+            texto = texto.strip().upper()
+            if texto and float(confianca) >= 0:
+                linhas.setdefault((bloco, paragrafo, linha), []).append((texto, float(confianca) / 100))
+
+        chaves = []
+        for palavras in linhas.values():
+            texto_linha = ''.join(texto for texto, _ in palavras)
+            confianca_linha = min(confianca for _, confianca in palavras)
+            for chave in PADRAO_CHAVE_NO_TEXTO.findall(texto_linha):
+                chaves.append(ChaveLida(corrigir_chave(chave), confianca_linha))
+        return ResultadoOCR(os.path.basename(caminho_imagem), self.nome, chaves, time.perf_counter() - inicio)
+
+
+@registrar_backend('falso')
+class BackendFalso(BackendOCR):
+    """Backend determinístico para testes e benchmarks: devolve respostas prontas por nome de arquivo.
+
+    `respostas` mapeia o nome do arquivo para uma lista de (chave, confiança); arquivos ausentes usam `padrao`.
+    """
+
+    def __init__(self, respostas: dict = None, padrao: list = (), latencia: float = 0.0):
+        self.respostas = respostas or {}
+        self.padrao = list(padrao)
+        self.latencia = latencia
+
+    def ler(self, caminho_imagem: str) -> ResultadoOCR:
+        inicio = time.perf_counter()
+        if self.latencia:
+            time.sleep(self.latencia)
+        nome = os.path.basename(caminho_imagem)
+        chaves = [ChaveLida(chave, confianca) for chave, confianca in self.respostas.get(nome, self.padrao)]
+        return ResultadoOCR(nome, self.nome, chaves, time.perf_counter() - inicio)
+
+
+@registrar_backend('cascata')
+class BackendCascata(BackendOCR):
+    """Tenta primeiro o backend local; só envia ao remoto as imagens sem nenhuma chave válida com confiança suficiente.
+
+    O local roda em todas as imagens primeiro (um por núcleo, sem limite de taxa nem repetição, já que a falha
+    escala), e as que sobram vão juntas ao remoto, que assim aproveita os lotes e o limite de taxa dele.
+    """
+
+    def __init__(self, local: str = 'tesseract', remoto: str = 'gemini', confianca_minima: float = 0.85):
+        self.local = criar_backend(local) if isinstance(local, str) else local
+        self.remoto = criar_backend(remoto) if isinstance(remoto, str) else remoto
+        self.confianca_minima = confianca_minima
+
+    def extrair(self, caminho_imagem: str, metricas=None) -> ResultadoOCR:
+        desfecho = []
+        self.extrair_varias([caminho_imagem], lambda _, __, resultado, erro: desfecho.append((resultado, erro)),
+                            metricas=metricas)
+        resultado, erro = desfecho[0]
+        if erro is not None:
+            raise erro
+        return resultado
+
+    def extrair_varias(self, caminhos: list, ao_concluir=None, cancelar=None, metricas=None, **limites) -> list:
+        caminhos = list(caminhos)
+        resultados = [None] * len(caminhos)
+        escalar = []
+
+        def ao_concluir_local(indice, caminho, resultado, erro):
+            if erro is None and resultado.tem_chave_confiavel(self.confianca_minima):
+                resultados[indice] = resultado
+                if ao_concluir:
+                    ao_concluir(indice, caminho, resultado, None)
+                return
+            if erro is not None:
+                print(f"OCR local falhou para '{os.path.basename(caminho)}': {erro}. Enviando ao backend remoto.")
+            escalar.append(indice)
+
+        self.local.extrair_varias(caminhos, ao_concluir_local, cancelar, metricas,
+                                  max_simultaneas=os.cpu_count() or 1, max_por_minuto=0, max_tentativas=1)
+        escalar.sort()
+        if cancelar is not None and cancelar.is_set():
+            return resultados
+        if len(caminhos) > 1:
+            print(f"OCR local resolveu {len(caminhos) - len(escalar)} de {len(caminhos)} imagens; "
+                  f"{len(escalar)} vão para o backend '{self.remoto.nome}'.")
+
+        def ao_concluir_remoto(posicao, caminho, resultado, erro):
+            resultados[escalar[posicao]] = resultado
+            if ao_concluir:
+                ao_concluir(escalar[posicao], caminho, resultado, erro)
+
+        self.remoto.extrair_varias([caminhos[i] for i in escalar], ao_concluir_remoto, cancelar, metricas)
+        return resultados
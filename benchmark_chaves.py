@@ -0,0 +1,371 @@
+"""Benchmarks do extrator, sem gastar cota da API.
+
+Uso:
+    python -m benchmark_chaves [--saida bench.json] [--comparar bench_anterior.json]
+
+A API Gemini é trocada por `GeminiFalso`, um substituto local com latência, taxa de erro e respostas
+`CHAVE:` configuráveis. Mede a vazão da extração de pasta por nível de concorrência, o custo de
+`_redesenhar_painel_completo` e `_atualizar_relatorio_validacao` por número de linhas, o tempo de
+`adicionar_ao_excel` conforme o registro cresce e o tempo de inicialização. O resultado é um JSON
+(por padrão `benchmark_<commit>.json`) que pode ser comparado com o de outro commit via `--comparar`.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from decodificador_chaves import ALFABETO_CHAVE
+
+
+PASTA_PROJETO = os.path.dirname(os.path.abspath(__file__))
+ALFABETO_ORDENADO = ''.join(sorted(ALFABETO_CHAVE))
+CHAVES_PADRAO = (
+    "NCKM6-93VT7-D64WF-2X9VK-MG9TT",
+    "GR79F-V4NGQ-RBGQK-X4RVV-PWF9C",
+    "W269N-WFGWX-YVC9B-4J6C9-T83GX",
+)
+
+
+def _chave_sintetica(numero: int) -> str:
+    """Chave válida e única para cada número (numeração em base 25 sobre o alfabeto das chaves)."""
+    caracteres = []
+    for _ in range(25):
+        numero, resto = divmod(numero, len(ALFABETO_ORDENADO))
+        caracteres.append(ALFABETO_ORDENADO[resto])
+    texto = ''.join(reversed(caracteres))
+    return '-'.join(texto[i:i + 5] for i in range(0, 25, 5))
+
+
+class ErroGeminiFalso(Exception):
+    def __init__(self, codigo: int):
+        super().__init__(f"{codigo} Erro simulado pelo Gemini falso")
+        self.code = codigo
+
+
+class _ModeloFalso:
+    def __init__(self, gemini):
+        self._gemini = gemini
+
+    def generate_content(self, partes):
+        return self._gemini._responder(partes)
+
+
+class GeminiFalso:
+    """Substituto local de `google.generativeai` com a mesma interface usada em `ocr_chaves`.
+
+    Cada chamada espera `latencia` segundos (± `variacao`), falha com `codigo_erro` na proporção `taxa_erro`
+    e responde `chaves_por_imagem` chaves de `chaves` por imagem, no formato simples ou no de lote.
+    """
+
+    def __init__(self, latencia: float = 0.05, variacao: float = 0.5, taxa_erro: float = 0.0, codigo_erro: int = 400,
+                 chaves=CHAVES_PADRAO, chaves_por_imagem: int = 1, semente: int = 0):
+        self.latencia = latencia
+        self.variacao = variacao
+        self.taxa_erro = taxa_erro
+        self.codigo_erro = codigo_erro
+        self.chaves = list(chaves)
+        self.chaves_por_imagem = chaves_por_imagem
+        self.chamadas = 0
+        self._proxima_chave = 0
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+
+    def configure(self, **opcoes):
+        pass
+
+    def GenerativeModel(self, nome_modelo):
+        return _ModeloFalso(self)
+
+    def _responder(self, partes):
+        imagens = [parte for parte in partes if not isinstance(parte, str)]
+        lote = any(isinstance(parte, str) and parte.startswith("IMAGEM ") for parte in partes)
+        with self._lock:
+            self.chamadas += 1
+            atraso = self.latencia * (1 + self._aleatorio.uniform(-self.variacao, self.variacao))
+            falhar = self._aleatorio.random() < self.taxa_erro
+            chaves = []
+            for _ in imagens:
+                chaves.append([self.chaves[(self._proxima_chave + i) % len(self.chaves)] for i in range(self.chaves_por_imagem)])
+                self._proxima_chave += self.chaves_por_imagem
+        time.sleep(max(atraso, 0))
+        if falhar:
+            raise ErroGeminiFalso(self.codigo_erro)
+
+        linhas = []
+        for numero, chaves_imagem in enumerate(chaves, start=1):
+            prefixo = f"IMAGEM {numero} | " if lote else ""
+            linhas.extend(f"{prefixo}CHAVE: {chave}" for chave in chaves_imagem)
+            if lote and not chaves_imagem:
+                linhas.append(f"{prefixo}NENHUMA")
+        texto = '\n'.join(linhas)
+        tokens_prompt = 300 + 260 * len(imagens)
+        tokens_resposta = max(1, len(texto) // 4)
+        return SimpleNamespace(text=texto, usage_metadata=SimpleNamespace(
+            prompt_token_count=tokens_prompt, candidates_token_count=tokens_resposta,
+            total_token_count=tokens_prompt + tokens_resposta))
+
+
+def _criar_imagens(pasta: str, quantidade: int) -> list:
+    """Gera imagens distintas (hashes diferentes) com o tamanho aproximado de uma foto de etiqueta."""
+    from PIL import Image, ImageDraw
+    caminhos = []
+    for i in range(quantidade):
+        img = Image.new('L', (1200, 900), color=200 + i % 50)
+        desenho = ImageDraw.Draw(img)
+        desenho.text((100, 400), _chave_sintetica(i), fill=0)
+        caminho = os.path.join(pasta, f"etiqueta_{i:05d}.png")
+        img.save(caminho)
+        caminhos.append(caminho)
+    return caminhos
+
+
+def _mediana_ms(funcao, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return round(statistics.median(tempos) * 1000, 3)
+
+
+def medir_vazao(pasta: str, quantidade: int, niveis: list, gemini: GeminiFalso, tamanho_lote: int = 1) -> list:
+    """Imagens por segundo da extração de pasta para cada número de requisições simultâneas (cache vazio a cada nível)."""
+    import ocr_chaves
+    from cache_ocr import CacheOCR
+
+    caminhos = _criar_imagens(pasta, quantidade)
+    originais = (ocr_chaves.genai, ocr_chaves._modelo_gemini, ocr_chaves._cache_ocr, ocr_chaves.BACKEND_OCR, ocr_chaves.MAX_REQUISICOES_SIMULTANEAS,
+                 ocr_chaves.MAX_REQUISICOES_POR_MINUTO, ocr_chaves.TAMANHO_LOTE_IMAGENS)
+    medidas = []
+    try:
+        ocr_chaves.genai, ocr_chaves._modelo_gemini = gemini, None
+        ocr_chaves.BACKEND_OCR = 'gemini'
+        ocr_chaves.MAX_REQUISICOES_POR_MINUTO = 0
+        ocr_chaves.TAMANHO_LOTE_IMAGENS = tamanho_lote
+        for simultaneas in niveis:
+            ocr_chaves.MAX_REQUISICOES_SIMULTANEAS = simultaneas
+            ocr_chaves._cache_ocr = CacheOCR(os.path.join(pasta, f"cache_{simultaneas}.sqlite3"))
+            chamadas_antes = gemini.chamadas
+            erros = 0
+
+            def ao_concluir(indice, caminho, resultado, erro):
+                nonlocal erros
+                erros += erro is not None
+
+            with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+                inicio = time.perf_counter()
+                ocr_chaves.extrair_chaves_de_varias_imagens(caminhos, ao_concluir=ao_concluir)
+                segundos = time.perf_counter() - inicio
+            ocr_chaves._cache_ocr.fechar()
+            medidas.append({'simultaneas': simultaneas, 'imagens': quantidade, 'segundos': round(segundos, 3),
+                            'imagens_por_segundo': round(quantidade / segundos, 2),
+                            'chamadas': gemini.chamadas - chamadas_antes, 'erros': erros})
+            print(f"Vazão com {simultaneas} simultâneas: {medidas[-1]['imagens_por_segundo']} imagens/s")
+    finally:
+        (ocr_chaves.genai, ocr_chaves._modelo_gemini, ocr_chaves._cache_ocr, ocr_chaves.BACKEND_OCR, ocr_chaves.MAX_REQUISICOES_SIMULTANEAS,
+         ocr_chaves.MAX_REQUISICOES_POR_MINUTO, ocr_chaves.TAMANHO_LOTE_IMAGENS) = originais
+    return medidas
+
+
+def _linhas_sinteticas(quantidade: int) -> list:
+    """Linhas do painel com ~5% de chaves inválidas e ~5% repetidas, como numa pasta real revisada."""
+    linhas = []
+    for i in range(quantidade):
+        if i % 20 == 7:
+            chave = _chave_sintetica(i)[:-1]
+        elif i % 20 == 13:
+            chave = _chave_sintetica(i - 1)
+        else:
+            chave = _chave_sintetica(i)
+        linhas.append({'Imagem': f"etiqueta_{i:05d}.png", 'Chave': chave})
+    return linhas
+
+
+def medir_painel(tamanhos: list, repeticoes: int) -> dict:
+    """Custo do redesenho do painel e do relatório de validação; precisa de uma tela (DISPLAY) para abrir a janela."""
+    import tkinter
+    try:
+        from extrair_chaves import App
+        app = App()
+    except tkinter.TclError as e:
+        print(f"Painel não medido (sem tela disponível): {e}")
+        return {'disponivel': False, 'motivo': str(e), 'medidas': []}
+
+    medidas = []
+    try:
+        app.withdraw()
+        for tamanho in tamanhos:
+            app.resultados_atuais.clear()
+            app.indice_validacao.limpar()
+            for linha in _linhas_sinteticas(tamanho):
+                app.resultados_atuais.append(linha)
+                app.indice_validacao.registrar(linha, len(app.resultados_atuais) - 1)
+
+            def redesenhar():
+                app._ultimo_relatorio = None
+                app._redesenhar_painel_completo()
+                app.update_idletasks()
+
+            def relatorio():
+                app._ultimo_relatorio = None
+                app._atualizar_relatorio_validacao()
+                app.update_idletasks()
+
+            medidas.append({'linhas': tamanho, 'redesenhar_painel_ms': _mediana_ms(redesenhar, repeticoes),
+                            'relatorio_validacao_ms': _mediana_ms(relatorio, repeticoes)})
+            print(f"Painel com {tamanho} linhas: {medidas[-1]}")
+    finally:
+        app.destroy()
+    return {'disponivel': True, 'motivo': None, 'medidas': medidas}
+
+
+def medir_registro(pasta: str, tamanhos: list, tamanho_lote: int = 100) -> list:
+    """Tempo de `adicionar_ao_excel` (um lote do painel no registro, metade repetida) e da exportação, por tamanho do registro."""
+    from registro_chaves import RegistroChaves
+
+    medidas = []
+    for tamanho in tamanhos:
+        registro = RegistroChaves(os.path.join(pasta, f"registro_{tamanho}.sqlite3"))
+        registro.adicionar({'Imagem': 'BASE', 'Chave': _chave_sintetica(i)} for i in range(tamanho))
+        lote = [{'Imagem': 'PAINEL', 'Chave': _chave_sintetica(tamanho - tamanho_lote // 2 + i)} for i in range(tamanho_lote)]
+        inicio = time.perf_counter()
+        registro.adicionar(lote)
+        adicionar_ms = (time.perf_counter() - inicio) * 1000
+        inicio = time.perf_counter()
+        registro.exportar_excel(os.path.join(pasta, f"registro_{tamanho}.xlsx"))
+        exportar_ms = (time.perf_counter() - inicio) * 1000
+        registro.fechar()
+        medidas.append({'chaves_no_registro': tamanho, 'adicionar_ms': round(adicionar_ms, 3), 'exportar_ms': round(exportar_ms, 3)})
+        print(f"Registro com {tamanho} chaves: {medidas[-1]}")
+    return medidas
+
+
+def _tempo_subprocesso_ms(codigo: str, repeticoes: int):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        processo = subprocess.run([sys.executable, '-c', codigo], cwd=PASTA_PROJETO, capture_output=True, text=True)
+        if processo.returncode != 0:
+            return None, (processo.stderr.strip().splitlines() or ['erro desconhecido'])[-1]
+        tempos.append(time.perf_counter() - inicio)
+    return round(statistics.median(tempos) * 1000, 1), None
+
+
+def medir_inicializacao(repeticoes: int) -> dict:
+    """Tempo, num interpretador novo, até os módulos estarem importados e até a janela aparecer."""
+    medidas = {}
+    for nome, codigo in (('importar_interface_ms', "import extrair_chaves"),
+                         ('importar_cli_ms', "import cli_chaves"),
+                         ('abrir_janela_ms', "import extrair_chaves as m; m.perfil_inicializacao()")):
+        medidas[nome], erro = _tempo_subprocesso_ms(codigo, repeticoes)
+        if erro:
+            medidas[nome.replace('_ms', '_erro')] = erro
+    print(f"Inicialização: {medidas}")
+    return medidas
+
+
+def _commit_atual() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PASTA_PROJETO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+
+def _achatar(valor, prefixo=''):
+    """Transforma o resultado em {caminho: número}; listas são indexadas pelo primeiro campo de cada item."""
+    if isinstance(valor, dict):
+        for chave, item in valor.items():
+            yield from _achatar(item, f"{prefixo}.{chave}" if prefixo else chave)
+    elif isinstance(valor, list):
+        for item in valor:
+            if isinstance(item, dict) and item:
+                campo, identificador = next(iter(item.items()))
+                yield from _achatar({k: v for k, v in item.items() if k != campo}, f"{prefixo}[{campo}={identificador}]")
+    elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        yield prefixo, valor
+
+
+def comparar(anterior: dict, atual: dict) -> list:
+    """Linhas de texto com a variação de cada medida presente nos dois resultados."""
+    valores_anteriores = dict(_achatar(anterior.get('resultados', {})))
+    linhas = []
+    for caminho, valor in _achatar(atual.get('resultados', {})):
+        antes = valores_anteriores.get(caminho)
+        if antes is None:
+            continue
+        variacao = f"{(valor - antes) / antes * 100:+.1f}%" if antes else "n/a"
+        linhas.append(f"{caminho}: {antes} -> {valor} ({variacao})")
+    return linhas
+
+
+ETAPAS = ('vazao', 'painel', 'registro', 'inicializacao')
+
+
+def _lista_de_inteiros(texto: str) -> list:
+    return [int(parte) for parte in texto.split(',') if parte.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark_chaves", description="Benchmarks do extrator com uma API Gemini falsa.")
+    parser.add_argument("--saida", help="Arquivo JSON de resultados. Padrão: benchmark_<commit>.json")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para mostrar a variação de cada medida.")
+    parser.add_argument("--etapas", nargs='+', choices=ETAPAS, default=list(ETAPAS), help="Quais medições rodar.")
+    parser.add_argument("--imagens", type=int, default=200, help="Imagens na pasta de teste da vazão.")
+    parser.add_argument("--simultaneas", type=_lista_de_inteiros, default=[1, 2, 4, 8, 16], help="Níveis de concorrência (ex.: 1,4,16).")
+    parser.add_argument("--lote", type=int, default=1, help="Imagens por requisição (TAMANHO_LOTE_IMAGENS).")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Latência média da API falsa, em segundos.")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração das chamadas que falham (0 a 1).")
+    parser.add_argument("--codigo-erro", type=int, default=400, help="Código dos erros simulados (429/5xx são repetidos pelo agendador).")
+    parser.add_argument("--linhas", type=_lista_de_inteiros, default=[100, 1000, 10000], help="Tamanhos do painel.")
+    parser.add_argument("--registro", type=_lista_de_inteiros, default=[0, 1000, 10000, 100000], help="Tamanhos do registro de chaves.")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Repetições por medida (vale a mediana).")
+    args = parser.parse_args(argv)
+
+    commit = _commit_atual()
+    gemini = GeminiFalso(latencia=args.latencia, taxa_erro=args.taxa_erro, codigo_erro=args.codigo_erro)
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="benchmark_chaves_") as pasta:
+        if 'vazao' in args.etapas:
+            resultados['vazao'] = medir_vazao(pasta, args.imagens, args.simultaneas, gemini, args.lote)
+        if 'painel' in args.etapas:
+            resultados['painel'] = medir_painel(args.linhas, args.repeticoes)
+        if 'registro' in args.etapas:
+            resultados['registro'] = medir_registro(pasta, args.registro)
+    if 'inicializacao' in args.etapas:
+        resultados['inicializacao'] = medir_inicializacao(args.repeticoes)
+
+    relatorio = {
+        'commit': commit,
+        'data': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('saida', 'comparar')},
+        'resultados': resultados,
+    }
+    saida = args.saida or f"benchmark_{commit}.json"
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em '{saida}'.")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anterior = json.load(f)
+        print(f"\nComparação com {anterior.get('commit', args.comparar)}:")
+        for linha in comparar(anterior, relatorio):
+            print(linha)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
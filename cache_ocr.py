@@ -0,0 +1,119 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Tamanho contado por entrada: o texto guardado mais as colunas da chave primária.
+TAMANHO_ENTRADA_SQL = "length(chaves) + length(hash_imagem) + length(modelo) + length(versao_prompt)"
+# Ao passar do limite, o despejo desce até esta fração dele, para não despejar de novo a cada inserção.
+FRACAO_APOS_DESPEJO = 0.9
+TAMANHO_BLOCO_DESPEJO = 500
+
+
+def hash_conteudo(dados: bytes) -> str:
+    """Hash SHA-256 do conteúdo do arquivo; dois arquivos iguais com nomes diferentes compartilham a mesma entrada."""
+    return hashlib.sha256(dados).hexdigest()
+
+
+class CacheOCR:
+    """Cache persistente (SQLite) das chaves extraídas, endereçado pelo conteúdo da imagem.
+
+    A entrada é identificada por (hash da imagem, modelo, versão do prompt), então trocar
+    o modelo ou o texto do prompt invalida automaticamente os resultados antigos.
+    Quando o tamanho guardado passa de `max_bytes`, as entradas menos usadas recentemente são removidas.
+    O tamanho é somado uma vez na abertura e depois mantido a cada `guardar`, sem varrer a tabela.
+    """
+
+    def __init__(self, caminho: str, max_bytes: int = 64 * 1024 * 1024):
+        self.caminho = caminho
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        with self._conexao:
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS resultados (
+                    hash_imagem TEXT NOT NULL,
+                    modelo TEXT NOT NULL,
+                    versao_prompt TEXT NOT NULL,
+                    chaves TEXT NOT NULL,
+                    criado_em REAL NOT NULL,
+                    ultimo_acesso REAL NOT NULL,
+                    PRIMARY KEY (hash_imagem, modelo, versao_prompt)
+                )
+            """)
+            self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_resultados_acesso ON resultados (ultimo_acesso)")
+        self._bytes = self._somar_bytes()
+
+    def _somar_bytes(self) -> int:
+        return self._conexao.execute(f"SELECT COALESCE(SUM({TAMANHO_ENTRADA_SQL}), 0) FROM resultados").fetchone()[0]
+
+    def obter(self, hash_imagem: str, modelo: str, versao_prompt: str):
+        """Devolve a lista de chaves guardada, ou `None` se não houver entrada."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT chaves FROM resultados WHERE hash_imagem = ? AND modelo = ? AND versao_prompt = ?",
+                (hash_imagem, modelo, versao_prompt)).fetchone()
+            if linha is None:
+                return None
+            with self._conexao:
+                self._conexao.execute(
+                    "UPDATE resultados SET ultimo_acesso = ? WHERE hash_imagem = ? AND modelo = ? AND versao_prompt = ?",
+                    (time.time(), hash_imagem, modelo, versao_prompt))
+            return json.loads(linha[0])
+
+    def guardar(self, hash_imagem: str, modelo: str, versao_prompt: str, chaves: list):
+        agora = time.time()
+        texto = json.dumps(chaves)
+        with self._lock, self._conexao:
+            anterior = self._conexao.execute(
+                f"SELECT {TAMANHO_ENTRADA_SQL} FROM resultados WHERE hash_imagem = ? AND modelo = ? AND versao_prompt = ?",
+                (hash_imagem, modelo, versao_prompt)).fetchone()
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?, ?)",
+                (hash_imagem, modelo, versao_prompt, texto, agora, agora))
+            self._bytes += len(texto) + len(hash_imagem) + len(modelo) + len(versao_prompt) - (anterior[0] if anterior else 0)
+            if self._bytes > self.max_bytes:
+                self._despejar_excedentes()
+
+    def _despejar_excedentes(self):
+        """Remove as entradas menos usadas até o tamanho descer a `FRACAO_APOS_DESPEJO` do limite."""
+        # Outro processo pode ter mexido no mesmo arquivo: o total é conferido antes de despejar.
+        self._bytes = self._somar_bytes()
+        alvo = int(self.max_bytes * FRACAO_APOS_DESPEJO)
+        while self._bytes > alvo:
+            bloco = self._conexao.execute(
+                f"SELECT rowid, {TAMANHO_ENTRADA_SQL} FROM resultados ORDER BY ultimo_acesso LIMIT ?",
+                (TAMANHO_BLOCO_DESPEJO,)).fetchall()
+            if not bloco:
+                break
+            remover = []
+            for rowid, tamanho in bloco:
+                if self._bytes <= alvo:
+                    break
+                remover.append((rowid,))
+                self._bytes -= tamanho
+            self._conexao.executemany("DELETE FROM resultados WHERE rowid = ?", remover)
+
+    def invalidar(self, hash_imagem: str = None, modelo: str = None, versao_prompt: str = None) -> int:
+        """Remove as entradas que batem com os filtros informados (sem filtros, limpa tudo). Devolve quantas foram removidas."""
+        condicoes, parametros = [], []
+        for coluna, valor in (('hash_imagem', hash_imagem), ('modelo', modelo), ('versao_prompt', versao_prompt)):
+            if valor is not None:
+                condicoes.append(f"{coluna} = ?")
+                parametros.append(valor)
+        sql = "DELETE FROM resultados"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        with self._lock, self._conexao:
+            removidas = self._conexao.execute(sql, parametros).rowcount
+            self._bytes = self._somar_bytes()
+            return removidas
+
+    def __len__(self):
+        with self._lock:
+            return self._conexao.execute("SELECT COUNT(*) FROM resultados").fetchone()[0]
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
@@ -0,0 +1,183 @@
+"""Modo em lote, sem interface gráfica.
+
+Uso:
+    python -m cli_chaves extrair PASTA [--saida chaves.jsonl] [--formato jsonl|csv] [--recomecar] [--metricas run.prom]
+                                       [--vigiar [--intervalo 5]]
+
+Cada resultado é gravado no arquivo de saída assim que a imagem termina. Um manifesto ao lado da saída
+registra as imagens concluídas, então rodar o mesmo comando de novo continua de onde parou.
+Com `--vigiar`, a pasta e as subpastas são varridas continuamente (até Ctrl+C) e só os arquivos novos ou
+alterados, já terminados de gravar, são processados.
+Códigos de saída: 0 = tudo certo, 1 = há chaves com formato inválido, 2 = houve imagens com erro.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+
+from ocr_chaves import extrair_chaves_de_varias_imagens, validar_formato_chave
+from manifesto import ManifestoProcessamento, MAX_TENTATIVAS_ARQUIVO
+from metricas_ocr import MetricasExecucao
+from observador_pasta import ObservadorPasta
+from entrada_documentos import EXTENSOES_ENTRADA
+
+
+TAMANHO_BLOCO_PADRAO = 256
+INTERVALO_VIGIA_PADRAO = 5.0
+
+
+def _listar_imagens(pasta: str):
+    """Percorre a pasta sem montar a lista inteira na memória."""
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_file() and entrada.name.lower().endswith(EXTENSOES_ENTRADA):
+                yield entrada.path
+
+
+def _blocos(iteravel, tamanho: int):
+    bloco = []
+    for item in iteravel:
+        bloco.append(item)
+        if len(bloco) >= tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+class _EscritorResultados:
+    """Grava cada linha {'Imagem', 'Chave', 'Valida'} imediatamente, em JSONL ou CSV."""
+
+    def __init__(self, arquivo, formato: str, escrever_cabecalho: bool):
+        self.arquivo = arquivo
+        self.formato = formato
+        if formato == 'csv':
+            self.csv = csv.writer(arquivo)
+            if escrever_cabecalho:
+                self.csv.writerow(['Imagem', 'Chave', 'Valida'])
+
+    def escrever(self, linhas: list):
+        for linha in linhas:
+            if self.formato == 'csv':
+                self.csv.writerow([linha['Imagem'], linha['Chave'], int(linha['Valida'])])
+            else:
+                self.arquivo.write(json.dumps(linha, ensure_ascii=False) + '\n')
+        self.arquivo.flush()
+
+
+def executar_extracao(pasta: str, saida: str, formato: str, caminho_manifesto: str,
+                      recomecar: bool = False, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO, arquivo_metricas: str = None,
+                      vigiar: bool = False, intervalo: float = INTERVALO_VIGIA_PADRAO) -> int:
+    manifesto = ManifestoProcessamento(caminho_manifesto)
+    metricas = MetricasExecucao(guardar_imagens=bool(arquivo_metricas))
+    if recomecar:
+        manifesto.limpar()
+    erros = 0
+
+    if saida == '-':
+        arquivo_saida, fechar_saida = sys.stdout, False
+        escrever_cabecalho = True
+    else:
+        modo = 'w' if recomecar else 'a'
+        escrever_cabecalho = recomecar or not os.path.exists(saida) or os.path.getsize(saida) == 0
+        arquivo_saida, fechar_saida = open(saida, modo, encoding='utf-8', newline=''), True
+    escritor = _EscritorResultados(arquivo_saida, formato, escrever_cabecalho)
+
+    def pendentes():
+        for caminho in _listar_imagens(pasta):
+            try:
+                info = os.stat(caminho)
+            except OSError:
+                continue
+            if (not manifesto.ja_processada(caminho, info.st_size, info.st_mtime)
+                    and manifesto.pode_tentar(caminho, info.st_size, info.st_mtime, respeitar_espera=False)):
+                yield caminho, info.st_size, info.st_mtime, None
+
+    def processar(bloco, observador=None):
+        """`bloco` é uma lista de (caminho, tamanho, mtime, hash)."""
+        def ao_concluir(indice, caminho, resultado, erro):
+            nonlocal erros
+            if observador is not None:
+                observador.concluir(caminho)
+            _, tamanho, mtime, hash_conteudo = bloco[indice]
+            if erro is not None:
+                erros += 1
+                tentativas = manifesto.registrar_falha(caminho, tamanho, mtime, erro, hash_conteudo)
+                print(f"Erro em '{caminho}' (tentativa {tentativas} de {MAX_TENTATIVAS_ARQUIVO}): {erro}")
+                return
+            linhas = [{'Imagem': r['Imagem'], 'Chave': r['Chave'], 'Valida': validar_formato_chave(r['Chave'])}
+                      for r in resultado]
+            escritor.escrever(linhas)
+            manifesto.marcar(caminho, tamanho, mtime, len(linhas), sum(1 for linha in linhas if not linha['Valida']),
+                             hash_conteudo)
+
+        extrair_chaves_de_varias_imagens([item[0] for item in bloco], ao_concluir=ao_concluir, metricas=metricas)
+
+    try:
+        # As mensagens de progresso do OCR vão para o stderr, deixando o stdout livre para os resultados.
+        with contextlib.redirect_stdout(sys.stderr):
+            if vigiar:
+                observador = ObservadorPasta(pasta, manifesto)
+                print(f"Vigiando '{pasta}' a cada {intervalo:g}s (Ctrl+C para encerrar)...")
+                try:
+                    while True:
+                        for bloco in _blocos(observador.varrer(), tamanho_bloco):
+                            processar(bloco, observador)
+                        time.sleep(intervalo)
+                except KeyboardInterrupt:
+                    print("Vigia encerrada.")
+            else:
+                for bloco in _blocos(pendentes(), tamanho_bloco):
+                    processar(bloco)
+    finally:
+        if fechar_saida:
+            arquivo_saida.close()
+
+    totais = manifesto.totais()
+    manifesto.fechar()
+    print(f"{totais['imagens']} imagens concluídas, {totais['chaves']} chaves "
+          f"({totais['invalidas']} com formato inválido), {erros} imagens com erro nesta execução.", file=sys.stderr)
+    if totais['desistidas']:
+        print(f"{totais['desistidas']} imagens deixadas de lado após {MAX_TENTATIVAS_ARQUIVO} falhas; "
+              f"elas voltam se forem alteradas ou com --recomecar.", file=sys.stderr)
+    if metricas.resumo_curto():
+        print(f"Nesta execução: {metricas.resumo_curto()}", file=sys.stderr)
+    if arquivo_metricas:
+        metricas.exportar(arquivo_metricas)
+    if erros:
+        return 2
+    if totais['invalidas']:
+        return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m cli_chaves", description="Extração de chaves de produto sem interface gráfica.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    extrair = subcomandos.add_parser("extrair", help="Extrai as chaves de todas as imagens de uma pasta.")
+    extrair.add_argument("pasta", help=f"Pasta com as imagens e documentos ({', '.join(EXTENSOES_ENTRADA)}).")
+    extrair.add_argument("--saida", default="chaves.jsonl", help="Arquivo de resultados ('-' para o stdout). Padrão: chaves.jsonl")
+    extrair.add_argument("--formato", choices=("jsonl", "csv"), help="Formato da saída. Padrão: deduzido da extensão da saída.")
+    extrair.add_argument("--manifesto", help="Arquivo do manifesto de progresso. Padrão: <saida>.manifesto.sqlite3")
+    extrair.add_argument("--recomecar", action="store_true", help="Ignora o progresso anterior e sobrescreve a saída.")
+    extrair.add_argument("--metricas", help="Grava os tempos por etapa, tokens e erros da execução (.json ou .prom para o Prometheus).")
+    extrair.add_argument("--vigiar", action="store_true", help="Continua vigiando a pasta (e subpastas) e processa os arquivos novos.")
+    extrair.add_argument("--intervalo", type=float, default=INTERVALO_VIGIA_PADRAO, help="Segundos entre as varreduras no modo --vigiar.")
+    extrair.add_argument("--bloco", type=int, default=TAMANHO_BLOCO_PADRAO, help="Imagens carregadas por vez (limita o uso de memória).")
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.pasta):
+        parser.error(f"pasta não encontrada: {args.pasta}")
+    formato = args.formato or ('csv' if args.saida.lower().endswith('.csv') else 'jsonl')
+    caminho_manifesto = args.manifesto or (("stdout" if args.saida == '-' else args.saida) + ".manifesto.sqlite3")
+    return executar_extracao(args.pasta, args.saida, formato, caminho_manifesto,
+                             recomecar=args.recomecar, tamanho_bloco=max(1, args.bloco), arquivo_metricas=args.metricas,
+                             vigiar=args.vigiar, intervalo=max(0.5, args.intervalo))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
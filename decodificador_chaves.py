@@ -0,0 +1,98 @@
+import re
+from itertools import product
+
+
+# Chaves de produto do Windows nunca usam A, E, I, O, U, L, S, Z, 0, 1 nem 5.
+ALFABETO_CHAVE = frozenset("BCDFGHJKMNPQRTVWXY2346789")
+
+# Caractere fora do alfabeto -> substitutos prováveis, com custo (menor = mais provável).
+TABELA_CONFUSAO = {
+    'O': (('Q', 1), ('D', 2)),
+    '0': (('D', 1), ('Q', 1)),
+    '1': (('T', 1), ('J', 1)),
+    'I': (('T', 1), ('J', 1)),
+    'L': (('T', 2), ('J', 2)),
+    '5': (('G', 1),),
+    'S': (('G', 1), ('8', 2)),
+    'Z': (('2', 1),),
+    'A': (('4', 2),),
+    'E': (('F', 2),),
+    'U': (('V', 2),),
+}
+
+MAX_COMBINACOES = 512
+# Entra na versão do cache de OCR: mudar a tabela ou as checagens invalida as chaves já corrigidas.
+VERSAO_DECODIFICADOR = 1
+_NAO_ALFANUMERICO = re.compile(r'[^A-Z0-9]')
+
+
+def _formatar(caracteres) -> str:
+    texto = ''.join(caracteres)
+    return '-'.join(texto[i:i + 5] for i in range(0, 25, 5))
+
+
+def _estrutura_valida(caracteres) -> bool:
+    """Checagens estruturais além do alfabeto: a partir do Windows 8, o 'N' aparece no máximo uma vez."""
+    return sum(1 for c in caracteres if c == 'N') <= 1
+
+
+def candidatos_chave(texto: str, limite: int = 5) -> list:
+    """Gera as chaves candidatas para um texto lido pelo OCR, ordenadas da mais provável para a menos provável.
+
+    Remove separadores e espaços, exige 25 caracteres, troca os caracteres fora do alfabeto pelos da
+    `TABELA_CONFUSAO` e descarta os candidatos que falham nas checagens estruturais.
+    Devolve uma lista de (chave formatada, custo); vazia se o texto não puder virar uma chave.
+    """
+    limpo = _NAO_ALFANUMERICO.sub('', (texto or '').upper())
+    if len(limpo) != 25:
+        return []
+
+    opcoes = []
+    for c in limpo:
+        if c in ALFABETO_CHAVE:
+            opcoes.append(((c, 0),))
+        elif c in TABELA_CONFUSAO:
+            opcoes.append(TABELA_CONFUSAO[c])
+        else:
+            return []
+
+    total = 1
+    for opcao in opcoes:
+        total *= len(opcao)
+    if total > MAX_COMBINACOES:
+        # Muitas posições ambíguas: fica só com o substituto mais provável de cada uma.
+        opcoes = [opcao[:1] for opcao in opcoes]
+
+    candidatos = []
+    for combinacao in product(*opcoes):
+        caracteres = [c for c, _ in combinacao]
+        if _estrutura_valida(caracteres):
+            candidatos.append((_formatar(caracteres), sum(custo for _, custo in combinacao)))
+    candidatos.sort(key=lambda candidato: candidato[1])
+    return candidatos[:limite]
+
+
+def sugerir_correcoes(texto: str, limite: int = 5) -> list:
+    """Chaves sugeridas para o painel (sem repetir o próprio texto, se ele já estiver correto)."""
+    atual = (texto or '').strip().upper()
+    return [chave for chave, _ in candidatos_chave(atual, limite) if chave != atual]
+
+
+def corrigir_chave(texto: str) -> str:
+    """Aplica a correção quando ela não é ambígua (cada caractere trocado tem um único substituto mais provável);
+    senão devolve o texto como veio, para o operador escolher entre as sugestões.
+    """
+    atual = (texto or '').strip().upper()
+    limpo = _NAO_ALFANUMERICO.sub('', atual)
+    if len(limpo) != 25:
+        return atual
+    caracteres = []
+    for c in limpo:
+        if c in ALFABETO_CHAVE:
+            caracteres.append(c)
+            continue
+        opcoes = TABELA_CONFUSAO.get(c)
+        if not opcoes or (len(opcoes) > 1 and opcoes[0][1] == opcoes[1][1]):
+            return atual
+        caracteres.append(opcoes[0][0])
+    return _formatar(caracteres) if _estrutura_valida(caracteres) else atual
@@ -0,0 +1,388 @@
+import io
+import os
+import re
+import threading
+
+
+EXTENSOES_IMAGEM = ('.png', '.jpg', '.jpeg')
+EXTENSOES_DOCUMENTO = ('.pdf', '.tif', '.tiff')
+EXTENSOES_ENTRADA = EXTENSOES_IMAGEM + EXTENSOES_DOCUMENTO
+# Só scans muito grandes são divididos: fotos comuns (12-108 MP) continuam sendo uma unidade e são reduzidas no
+# pré-processamento. O padrão fica abaixo do maior PNG/TIFF comprimido que pode ser decodificado inteiro
+# (`_limite_decodificacao`, ~179 MP com o limite padrão do Pillow), para que as páginas divididas desses formatos
+# possam ser lidas. Acima de MAX_PIXELS_UNIDADE, a página vira blocos de LADO_BLOCO x LADO_BLOCO que se sobrepõem em
+# FRACAO_SOBREPOSICAO_BLOCO do lado (2000 px no padrão, mais que a linha de uma chave num scan de 600 dpi), para que
+# cada chave caiba inteira em pelo menos um bloco.
+MAX_PIXELS_UNIDADE = int(os.getenv("MAX_PIXELS_UNIDADE", "120000000"))
+LADO_BLOCO = int(os.getenv("LADO_BLOCO", "4000"))
+FRACAO_SOBREPOSICAO_BLOCO = float(os.getenv("FRACAO_SOBREPOSICAO_BLOCO", "0.5"))
+RESOLUCAO_PDF = int(os.getenv("RESOLUCAO_PDF", "300"))
+# Maior página que pode ser decodificada inteira na memória (PNG, TIFF comprimido). JPEGs maiores são lidos em escala
+# reduzida; PDFs e TIFFs sem compressão são lidos só na região de cada bloco. Vale também o limite global do Pillow.
+MAX_PIXELS_DECODIFICACAO = int(os.getenv("MAX_PIXELS_DECODIFICACAO", "300000000"))
+# Maior imagem aceita na leitura de documentos. Substitui, só aqui, o `Image.MAX_IMAGE_PIXELS` do Pillow (que recusa
+# scans grandes já na abertura); o limite global continua valendo para o resto do programa.
+MAX_PIXELS_ARQUIVO = 1_000_000_000
+FORMATOS_SEM_LIMITE_GLOBAL = ('TIFF', 'JPEG', 'PNG')
+
+# Bits por pixel dos modos "crus" (sem compressão) cujas linhas podem ser lidas direto do arquivo.
+BITS_POR_PIXEL_RAW = {'1': 1, 'L': 8, 'P': 8, 'LA': 16, 'RGB': 24, 'RGBA': 32, 'RGBX': 32, 'CMYK': 32}
+
+PADRAO_UNIDADE = re.compile(r'^(?P<arquivo>.+)#(?:p(?P<pagina>\d+))?(?:-?b(?P<bloco>\d+))?$')
+
+# O PDFium não pode ser usado por duas threads ao mesmo tempo.
+_pdfium_lock = threading.Lock()
+# A última página decodificada inteira, reaproveitada pelos blocos seguintes da mesma página e liberada
+# quando o último bloco dela termina (`JuncaoUnidades`) ou ao fim da extração.
+_pagina_decodificada = None
+_pagina_lock = threading.Lock()
+
+
+def _posicoes(total: int, lado: int, sobreposicao: int) -> list:
+    if total <= lado:
+        return [0]
+    passo = max(1, lado - sobreposicao)
+    return list(range(0, total - lado, passo)) + [total - lado]
+
+
+def caixas_blocos(largura: int, altura: int) -> list:
+    """As caixas (x0, y0, x1, y1) dos blocos de uma página, da esquerda para a direita e de cima para baixo."""
+    sobreposicao = int(LADO_BLOCO * FRACAO_SOBREPOSICAO_BLOCO)
+    return [(x, y, min(x + LADO_BLOCO, largura), min(y + LADO_BLOCO, altura))
+            for y in _posicoes(altura, LADO_BLOCO, sobreposicao)
+            for x in _posicoes(largura, LADO_BLOCO, sobreposicao)]
+
+
+def separar_unidade(referencia: str):
+    """Devolve (arquivo, página, bloco) de uma referência como 'scan.pdf#p3-b2', ou `None` para um arquivo comum.
+
+    Página e bloco começam em 1; ficam `None` quando não se aplicam.
+    """
+    if '#' not in referencia or os.path.exists(referencia):
+        return None
+    correspondencia = PADRAO_UNIDADE.match(referencia)
+    if correspondencia is None or not (correspondencia.group('pagina') or correspondencia.group('bloco')):
+        return None
+    pagina, bloco = correspondencia.group('pagina'), correspondencia.group('bloco')
+    return correspondencia.group('arquivo'), int(pagina) if pagina else None, int(bloco) if bloco else None
+
+
+def _unidades_da_pagina(caminho: str, pagina, largura: int, altura: int):
+    base = caminho if pagina is None else f"{caminho}#p{pagina}"
+    if largura * altura <= MAX_PIXELS_UNIDADE:
+        yield base
+        return
+    for bloco in range(1, len(caixas_blocos(largura, altura)) + 1):
+        yield f"{base}-b{bloco}" if pagina is not None else f"{caminho}#b{bloco}"
+
+
+def _e_pdf(caminho: str) -> bool:
+    return caminho.lower().endswith('.pdf')
+
+
+def _pdfium():
+    try:
+        import pypdfium2
+    except ImportError:
+        raise ImportError("Ler PDFs requer o pacote 'pypdfium2' (pip install pypdfium2).") from None
+    return pypdfium2
+
+
+def _tamanho_pagina_pdf(pagina) -> tuple:
+    largura, altura = pagina.get_size()
+    return round(largura * RESOLUCAO_PDF / 72), round(altura * RESOLUCAO_PDF / 72)
+
+
+def _abrir_imagem(caminho: str):
+    """`Image.open` com o limite `MAX_PIXELS_ARQUIVO` no lugar do global do Pillow, sem alterá-lo.
+
+    TIFF, JPEG e PNG são abertos direto pelo plugin do formato (que não faz a checagem global); a memória fica
+    limitada pela decodificação por região ou por `_limite_decodificacao`. Outros formatos usam `Image.open`.
+    """
+    from PIL import Image
+    Image.init()
+    with open(caminho, 'rb') as f:
+        prefixo = f.read(16)
+    for formato in FORMATOS_SEM_LIMITE_GLOBAL:
+        fabrica, aceita = Image.OPEN[formato]
+        if aceita is None or aceita(prefixo):
+            break
+    else:
+        return Image.open(caminho)
+    try:
+        img = fabrica(caminho, caminho)
+    except Exception as e:
+        raise Image.UnidentifiedImageError(f"Não foi possível ler a imagem '{caminho}': {e}") from e
+    largura, altura = img.size
+    if largura * altura > MAX_PIXELS_ARQUIVO:
+        img.close()
+        raise Image.DecompressionBombError(
+            f"'{caminho}' tem {largura * altura / 1e6:.0f} MP, acima de MAX_PIXELS_ARQUIVO ({MAX_PIXELS_ARQUIVO / 1e6:.0f} MP).")
+    return img
+
+
+def listar_unidades(caminho: str):
+    """Gera as unidades de extração de um arquivo, lendo só os cabeçalhos (nenhum pixel é decodificado aqui).
+
+    Uma imagem comum que cabe em `MAX_PIXELS_UNIDADE` é a própria unidade (o caminho sem mudança). PDFs e TIFFs
+    de várias páginas viram uma unidade por página ('doc.pdf#p3'), e páginas grandes demais viram blocos
+    sobrepostos ('doc.pdf#p3-b2', 'scan.png#b4').
+    """
+    if _e_pdf(caminho):
+        pdfium = _pdfium()
+        with _pdfium_lock:
+            documento = pdfium.PdfDocument(caminho)
+            try:
+                tamanhos = []
+                for i in range(len(documento)):
+                    pagina = documento[i]
+                    tamanhos.append(_tamanho_pagina_pdf(pagina))
+                    pagina.close()
+            finally:
+                documento.close()
+        for numero, (largura, altura) in enumerate(tamanhos, start=1):
+            yield from _unidades_da_pagina(caminho, numero, largura, altura)
+        return
+
+    with _abrir_imagem(caminho) as img:
+        paginas = getattr(img, 'n_frames', 1)
+        tamanhos = []
+        for i in range(paginas):
+            img.seek(i)
+            largura, altura = img.size
+            if largura * altura > MAX_PIXELS_UNIDADE and not _regiao_decodificavel(img):
+                # Recusa o arquivo uma vez aqui, em vez de gerar blocos que falhariam um a um.
+                _conferir_decodificacao(img, i + 1 if paginas > 1 else None)
+            tamanhos.append((largura, altura))
+    for numero, (largura, altura) in enumerate(tamanhos, start=1):
+        yield from _unidades_da_pagina(caminho, numero if paginas > 1 else None, largura, altura)
+
+
+def _renderizar_pdf(arquivo: str, pagina: int, bloco):
+    pdfium = _pdfium()
+    with _pdfium_lock:
+        documento = pdfium.PdfDocument(arquivo)
+        try:
+            pagina_pdf = documento[pagina - 1]
+            largura, altura = _tamanho_pagina_pdf(pagina_pdf)
+            corte = (0, 0, 0, 0)
+            if bloco is not None:
+                # Renderiza só a região do bloco; o corte é em pontos, a partir de cada borda (esquerda, baixo, direita, cima).
+                x0, y0, x1, y1 = caixas_blocos(largura, altura)[bloco - 1]
+                fator = 72 / RESOLUCAO_PDF
+                corte = (x0 * fator, (altura - y1) * fator, (largura - x1) * fator, y0 * fator)
+            img = pagina_pdf.render(scale=RESOLUCAO_PDF / 72, crop=corte, grayscale=True).to_pil()
+            pagina_pdf.close()
+        finally:
+            documento.close()
+    return img
+
+
+def _linhas_do_tile(tile, y0: int, y1: int):
+    """Reduz um tile 'raw' (linhas de cima para baixo) às linhas [y0, y1), avançando o offset no arquivo."""
+    codec, (tx0, ty0, tx1, ty1), offset, args = tile
+    if codec != 'raw' or not isinstance(args, tuple) or len(args) < 3 or args[2] != 1:
+        return tile
+    bits = BITS_POR_PIXEL_RAW.get(args[0])
+    if bits is None:
+        return tile
+    bytes_por_linha = args[1] or ((tx1 - tx0) * bits + 7) // 8
+    inicio, fim = max(ty0, y0), min(ty1, y1)
+    return codec, (tx0, inicio, tx1, fim), offset + (inicio - ty0) * bytes_por_linha, args
+
+
+def _regiao_decodificavel(img) -> bool:
+    """Se dá para ler só uma região: TIFF sem compressão (faixas ou tiles lidos pelo próprio Pillow, sem libtiff)."""
+    if img.format != 'TIFF' or getattr(img, 'use_load_libtiff', False):
+        return False
+    return len(img.tile) > 1 or _linhas_do_tile(img.tile[0], 0, 1) != img.tile[0]
+
+
+def _decodificar_regiao(img, caixa):
+    """Decodifica só as faixas do arquivo (strips/tiles de um TIFF sem compressão) que cruzam a caixa."""
+    x0, y0, x1, y1 = caixa
+    partes = [_linhas_do_tile(t, y0, y1) for t in img.tile if t[1][0] < x1 and t[1][2] > x0 and t[1][1] < y1 and t[1][3] > y0]
+    ux0, uy0 = min(t[1][0] for t in partes), min(t[1][1] for t in partes)
+    ux1, uy1 = max(t[1][2] for t in partes), max(t[1][3] for t in partes)
+    img.tile = [(t[0], (t[1][0] - ux0, t[1][1] - uy0, t[1][2] - ux0, t[1][3] - uy0), t[2], t[3]) for t in partes]
+    img._size = (ux1 - ux0, uy1 - uy0)
+    img.load()
+    return img.crop((x0 - ux0, y0 - uy0, x1 - ux0, y1 - uy0))
+
+
+def _limite_decodificacao() -> int:
+    """Maior página decodificada inteira: `MAX_PIXELS_DECODIFICACAO`, sem passar do limite global do Pillow (que
+    ele também confere ao decodificar e recortar, e que não alteramos)."""
+    from PIL import Image
+    if Image.MAX_IMAGE_PIXELS:
+        return min(MAX_PIXELS_DECODIFICACAO, 2 * Image.MAX_IMAGE_PIXELS)
+    return MAX_PIXELS_DECODIFICACAO
+
+
+def _fator_decodificacao(img, limite: int):
+    """Fator de redução (1, ou 2/4/8 para JPEG) com que a página cabe em `limite` pixels, ou `None` se não couber."""
+    largura, altura = img.size
+    fator = 1
+    while (largura / fator) * (altura / fator) > limite:
+        if img.format != 'JPEG' or fator == 8:
+            return None
+        fator *= 2
+    return fator
+
+
+def _conferir_decodificacao(img, pagina=None) -> int:
+    """Devolve o fator de `_fator_decodificacao` ou lança `DecompressionBombError` se a página não puder ser lida."""
+    from PIL import Image
+    limite = _limite_decodificacao()
+    fator = _fator_decodificacao(img, limite)
+    if fator is None:
+        largura, altura = img.size
+        onde = f"A página {pagina}" if pagina is not None else "A imagem"
+        raise Image.DecompressionBombError(
+            f"{onde} tem {largura * altura / 1e6:.0f} MP e, em {img.format}, precisa ser decodificada inteira, acima "
+            f"do limite de {limite / 1e6:.0f} MP (ver MAX_PIXELS_DECODIFICACAO e o limite do Pillow). "
+            f"PDFs, JPEGs e TIFFs sem compressão não têm esse limite.")
+    return fator
+
+
+def _pagina_inteira(arquivo: str, img, pagina):
+    """Decodifica a página inteira (uma vez para todos os blocos dela). Devolve (imagem, escala em relação ao original)."""
+    global _pagina_decodificada
+    chave = (arquivo, os.path.getmtime(arquivo), pagina)
+    with _pagina_lock:
+        if _pagina_decodificada is not None and _pagina_decodificada[0] == chave:
+            return _pagina_decodificada[1:]
+        _pagina_decodificada = None  # libera a anterior antes de decodificar a próxima
+        largura, altura = img.size
+        fator = _conferir_decodificacao(img, pagina)
+        if fator > 1:
+            # O JPEG pode ser decodificado já reduzido (1/2, 1/4 ou 1/8), sem passar pelo tamanho cheio.
+            img.draft(img.mode, (-(-largura // fator), -(-altura // fator)))
+        img.load()
+        _pagina_decodificada = (chave, img, img.size[0] / largura)
+        return img, img.size[0] / largura
+
+
+def liberar_pagina_decodificada(arquivo: str = None, pagina=None):
+    """Descarta a página guardada para os blocos: a deste arquivo/página, ou qualquer uma sem argumentos."""
+    global _pagina_decodificada
+    with _pagina_lock:
+        if _pagina_decodificada is None:
+            return
+        guardado, _, pagina_guardada = _pagina_decodificada[0]
+        if arquivo is None or (guardado == arquivo and pagina_guardada == pagina):
+            _pagina_decodificada = None
+
+
+def abrir_unidade(referencia: str):
+    """Abre a página ou o bloco de uma referência de `listar_unidades` como imagem do Pillow (já decodificada)."""
+    partes = separar_unidade(referencia)
+    if partes is None:
+        img = _abrir_imagem(referencia)
+        img.load()
+        return img
+    arquivo, pagina, bloco = partes
+    if _e_pdf(arquivo):
+        return _renderizar_pdf(arquivo, pagina, bloco)
+
+    img = _abrir_imagem(arquivo)
+    if pagina is not None:
+        img.seek(pagina - 1)
+    if bloco is None:
+        img.load()
+        return img
+    caixa = caixas_blocos(*img.size)[bloco - 1]
+    if _regiao_decodificavel(img):
+        with img:
+            return _decodificar_regiao(img, caixa)
+    inteira, escala = _pagina_inteira(arquivo, img, pagina)
+    if inteira is not img:
+        img.close()
+    return inteira.crop(tuple(round(c * escala) for c in caixa))
+
+
+def ler_unidade(referencia: str) -> bytes:
+    """Os bytes (PNG) da página ou do bloco, prontos para o cache e o pré-processamento."""
+    img = abrir_unidade(referencia)
+    if img.mode not in ('1', 'L', 'RGB', 'RGBA'):
+        img = img.convert('RGB')
+    saida = io.BytesIO()
+    img.save(saida, format='PNG', compress_level=1)
+    return saida.getvalue()
+
+
+class JuncaoUnidades:
+    """Junta os resultados das unidades (páginas e blocos) de volta em um resultado por arquivo.
+
+    Uma chave lida em dois blocos da mesma página (por causa da sobreposição) aparece uma só vez, com o nome
+    do primeiro bloco. `ao_concluir(indice, caminho, resultado, erro)` é chamado quando todas as unidades
+    do arquivo terminam; se alguma falhou, o arquivo inteiro fica com o erro.
+    """
+
+    def __init__(self, caminhos: list, ao_concluir=None):
+        self.caminhos = caminhos
+        self.ao_concluir = ao_concluir
+        self.unidades = []
+        self.resultados = [None] * len(caminhos)
+        self._dono = []
+        self._unidades_do_arquivo = [[] for _ in caminhos]
+        self._linhas = {}
+        self._restantes = [0] * len(caminhos)
+        self._blocos_restantes = {}
+        self._erros = [None] * len(caminhos)
+
+    def adicionar(self, indice: int, unidades):
+        for unidade in unidades:
+            self._unidades_do_arquivo[indice].append(len(self.unidades))
+            self._dono.append(indice)
+            self.unidades.append(unidade)
+            self._restantes[indice] += 1
+            partes = separar_unidade(unidade)
+            if partes is not None and partes[2] is not None:
+                self._blocos_restantes[(indice, partes[1])] = self._blocos_restantes.get((indice, partes[1]), 0) + 1
+        if not self._restantes[indice]:
+            self._concluir_arquivo(indice)
+
+    def falhar(self, indice: int, erro: Exception):
+        """Registra um arquivo que nem pôde ser dividido em unidades (PDF corrompido, sem `pypdfium2`...)."""
+        self._erros[indice] = erro
+        self._concluir_arquivo(indice)
+
+    def ao_concluir_unidade(self, posicao: int, unidade: str, resultado, erro):
+        indice = self._dono[posicao]
+        if erro is not None:
+            self._erros[indice] = self._erros[indice] or erro
+        else:
+            self._linhas[posicao] = resultado or []
+        partes = separar_unidade(unidade)
+        if partes is not None and partes[2] is not None:
+            # Último bloco da página: a página decodificada inteira não é mais necessária.
+            self._blocos_restantes[(indice, partes[1])] -= 1
+            if not self._blocos_restantes[(indice, partes[1])]:
+                del self._blocos_restantes[(indice, partes[1])]
+                liberar_pagina_decodificada(partes[0], partes[1])
+        self._restantes[indice] -= 1
+        if not self._restantes[indice]:
+            self._concluir_arquivo(indice)
+
+    def _concluir_arquivo(self, indice: int):
+        erro = self._erros[indice]
+        resultado = None
+        if erro is None:
+            resultado = []
+            vistas = {}
+            for posicao in self._unidades_do_arquivo[indice]:
+                partes = separar_unidade(self.unidades[posicao])
+                for linha in self._linhas.pop(posicao, []):
+                    if partes is not None and partes[2] is not None:
+                        chaves_da_pagina = vistas.setdefault(partes[1], set())
+                        if linha['Chave'] in chaves_da_pagina:
+                            continue
+                        chaves_da_pagina.add(linha['Chave'])
+                    resultado.append(linha)
+        else:
+            for posicao in self._unidades_do_arquivo[indice]:
+                self._linhas.pop(posicao, None)
+        self.resultados[indice] = resultado
+        if self.ao_concluir:
+            self.ao_concluir(indice, self.caminhos[indice], resultado, erro)
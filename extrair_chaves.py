@@ -1,18 +1,38 @@
+import time
+_INICIO_IMPORTACAO = time.perf_counter()
 import os
 import sys
-import pandas as pd
+import json
+import queue
 import threading
 import customtkinter as ctk
-from tkinter import filedialog, messagebox, StringVar
-from PIL import Image
-from dotenv import load_dotenv
-import google.generativeai as genai
-import re
+from tkinter import filedialog, messagebox
+from ocr_chaves import (validar_formato_chave, extrair_chaves_de_varias_imagens,
+                        obter_cache_ocr, aquecer_em_segundo_plano)
+from painel_chaves import PainelChavesVirtual
+from indice_validacao import IndiceValidacao
+from registro_chaves import RegistroChaves
+from decodificador_chaves import sugerir_correcoes
+from metricas_ocr import MetricasExecucao
+from manifesto import ManifestoProcessamento, MAX_TENTATIVAS_ARQUIVO
+from observador_pasta import ObservadorPasta
+from entrada_documentos import EXTENSOES_ENTRADA
 
 
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 NOME_ARQUIVO_EXCEL = 'chaves_extraidas_final.xlsx'
+ARQUIVO_REGISTRO_CHAVES = 'registro_chaves.sqlite3'
+INTERVALO_RELATORIO_MS = 16
+LIMITE_LINHAS_RELATORIO = 200
+INTERVALO_FILA_MS = 50
+MAX_MENSAGENS_POR_DRENAGEM = 100
+# Modo "Vigiar Pasta": manifesto das imagens já processadas (fica entre as execuções) e segundos entre as varreduras.
+ARQUIVO_MANIFESTO_VIGIA = 'pasta_vigiada.manifesto.sqlite3'
+INTERVALO_VIGIA_S = float(os.getenv("INTERVALO_VIGIA_S", "5"))
+# Se definido, as métricas de cada extração são gravadas nele (.json ou .prom para o textfile do Prometheus).
+ARQUIVO_METRICAS = os.getenv("ARQUIVO_METRICAS", "")
+# Modo `--perfil-inicializacao`: tempo máximo até a janela aparecer e módulos que não podem ser carregados antes disso.
+ORCAMENTO_INICIALIZACAO_MS = int(os.getenv("ORCAMENTO_INICIALIZACAO_MS", "1500"))
+MODULOS_SOB_DEMANDA = ('google.generativeai', 'pandas', 'openpyxl', 'cv2', 'numpy', 'pytesseract', 'pypdfium2')
 
 
 
@@ -25,60 +45,9 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
-def validar_formato_chave(chave: str) -> bool:
-    """Verifica se a chave segue o padrão XXXXX-XXXXX-XXXXX-XXXXX-XXXXX."""
-    padrao = re.compile(r'^[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}$')
-    return bool(padrao.match(chave))
-
-
-def extrair_chaves_da_imagem(caminho_imagem: str) -> list:
-    """Usa um prompt simplificado para extrair apenas as chaves da imagem."""
-    nome_arquivo = os.path.basename(caminho_imagem)
-    print(f"\nExtraindo chaves de '{nome_arquivo}'...")
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        img = Image.open(caminho_imagem)
-        
-        prompt = """
-        Sua tarefa é atuar como um especialista em OCR para transcrever chaves de produto do Windows a partir da imagem com a máxima precisão.
-
-        REGRAS E DIRETRIZES IMPORTANTES:
-        1.  **Formato Exato:** A chave DEVE seguir o formato `XXXXX-XXXXX-XXXXX-XXXXX-XXXXX`. São 5 blocos de 5 caracteres alfanuméricos cada.
-        2.  **Caracteres Válidos:** Chaves de produto do Windows usam apenas letras maiúsculas e números. Elas NUNCA contêm as seguintes letras: A, E, I, O, U, L, S, Z. Elas NUNCA contêm os seguintes números: 0, 1, 5.
-        3.  **Correção de Ambiguidade:** Preste atenção extra a caracteres que são visualmente semelhantes. Siga estas regras de substituição:
-            - Se vir um 'O', transcreva como 'Q'.
-            - Se vir um '0', transcreva como 'D' ou 'Q'.
-            - Se vir um '8', transcreva como 'B'.
-            - Se vir um '1', transcreva como 'T' ou 'J'.
-            - Se vir um '5', transcreva como 'G'.
-            - Se vir um 'S', transcreva como 'G'.
-            - Se vir um 'Z', transcreva como '2'.
-            - Se vir um 'I', transcreva como 'T' ou 'J'.
-        4.  **Saída Limpa:** Liste cada chave encontrada numa nova linha, começando com "CHAVE: ". Não inclua nenhum outro texto ou comentário.
-
-        Exemplo de saída esperada:
-        CHAVE: NCKM6-93VT7-D64WF-2X9VK-MG9TT
-        CHAVE: GR79F-V4NGQ-RBGQK-X4RVV-PWF9C
-        """
-        
-        response = model.generate_content([prompt, img])
-        print(f"Texto recebido com sucesso.")
-
-        if not response.text: return []
-        
-        resultados = []
-        linhas = response.text.strip().split('\n')
-        for linha in linhas:
-            if linha.upper().startswith("CHAVE:"):
-                chave = linha[len("CHAVE:"):].strip().upper()
-                resultados.append({'Imagem': nome_arquivo, 'Chave': chave})
-        return resultados
-
-    except Exception as e:
-        print(f"Erro na chamada da API Gemini para '{nome_arquivo}': {e}")
-        return []
-
+def formatar_duracao(segundos):
+    segundos = int(round(segundos))
+    return f"{segundos // 60}min {segundos % 60:02d}s" if segundos >= 60 else f"{segundos}s"
 
 
 class App(ctk.CTk):
@@ -97,7 +66,13 @@ class App(ctk.CTk):
 
         
         self.resultados_atuais = []
-        self.widgets_linhas = []
+        self._registro = None
+        self.indice_validacao = IndiceValidacao(validar_formato_chave, sugerir_correcoes)
+        self._relatorio_agendado = False
+        self._ultimo_relatorio = None
+        self._cancelar_extracao = threading.Event()
+        self._andamento = None
+        self._metricas = None
         self.title_font = ctk.CTkFont(family="Arial", size=18, weight="bold")
         self.main_font = ctk.CTkFont(family="Arial", size=12)
         self.status_font = ctk.CTkFont(family="Arial", size=11)
@@ -109,17 +84,25 @@ class App(ctk.CTk):
         
         self.frame_superior = ctk.CTkFrame(self, corner_radius=0)
         self.frame_superior.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
-        self.frame_superior.grid_columnconfigure(3, weight=1) 
+        self.frame_superior.grid_columnconfigure(4, weight=1) 
 
         self.botao_carregar_arquivo = ctk.CTkButton(self.frame_superior, text="Carregar Arquivo", command=self.iniciar_extracao_arquivo)
         self.botao_carregar_arquivo.grid(row=0, column=0, padx=5, pady=5)
         self.botao_carregar_pasta = ctk.CTkButton(self.frame_superior, text="Carregar Pasta", command=self.iniciar_extracao_pasta)
         self.botao_carregar_pasta.grid(row=0, column=1, padx=5, pady=5)
+        self.botao_vigiar_pasta = ctk.CTkButton(self.frame_superior, text="Vigiar Pasta", command=self.iniciar_vigia_pasta)
+        self.botao_vigiar_pasta.grid(row=0, column=2, padx=5, pady=5)
+        self.botao_limpar_cache = ctk.CTkButton(self.frame_superior, text="Limpar Cache OCR", command=self.limpar_cache_ocr, fg_color="#585858", hover_color="#404040")
+        self.botao_limpar_cache.grid(row=0, column=3, padx=5, pady=5)
         self.botao_limpar = ctk.CTkButton(self.frame_superior, text="Limpar Painel", command=self.limpar_tudo, fg_color="#585858", hover_color="#404040")
-        self.botao_limpar.grid(row=0, column=4, padx=5, pady=5)
+        self.botao_limpar.grid(row=0, column=5, padx=5, pady=5)
 
         
-        self.frame_rolavel = ctk.CTkScrollableFrame(self, label_text="Chaves Extraídas", label_font=self.title_font)
+        self.frame_rolavel = PainelChavesVirtual(self, self.resultados_atuais, validar_formato_chave,
+                                                 ao_mover=self.mover_linha, ao_excluir=self.excluir_linha_chave,
+                                                 ao_editar=self._ao_editar_linha, sugerir=sugerir_correcoes,
+                                                 label_text="Chaves Extraídas", label_font=self.title_font,
+                                                 fonte=self.main_font, fonte_status=self.status_font)
         self.frame_rolavel.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
 
         
@@ -147,91 +130,225 @@ class App(ctk.CTk):
         self.frame_status_progresso.grid_columnconfigure(0, weight=1)
         self.label_status = ctk.CTkLabel(self.frame_status_progresso, text="Pronto. Selecione um arquivo ou pasta para começar.", text_color="gray", font=self.status_font)
         self.label_status.grid(row=0, column=0, sticky="w")
+        self.label_metricas = ctk.CTkLabel(self.frame_status_progresso, text="", text_color="gray", font=self.status_font)
+        self.label_metricas.grid(row=1, column=0, columnspan=3, sticky="w")
         self.progressbar = ctk.CTkProgressBar(self.frame_status_progresso, orientation="horizontal")
+        self.botao_cancelar = ctk.CTkButton(self.frame_status_progresso, text="Cancelar", width=80, fg_color="firebrick", hover_color="darkred", command=self.cancelar_extracao)
         
         self.frame_salvar = ctk.CTkFrame(self.frame_status_salvar, fg_color="transparent")
         self.frame_salvar.pack(fill="x", expand=True, side="bottom", padx=5, pady=10)
         self.frame_salvar.grid_columnconfigure((0,1), weight=1)
-        self.botao_adicionar_excel = ctk.CTkButton(self.frame_salvar, text="Adicionar ao Excel", fg_color="sea green", hover_color="dark green", command=self.adicionar_ao_excel)
+        self.botao_adicionar_excel = ctk.CTkButton(self.frame_salvar, text="Adicionar ao Registro", fg_color="sea green", hover_color="dark green", command=self.adicionar_ao_excel)
         self.botao_adicionar_excel.grid(row=0, column=0, padx=(0,5), pady=5, sticky="ew")
         self.botao_substituir_excel = ctk.CTkButton(self.frame_salvar, text="Substituir a Planilha", command=self.substituir_em_excel)
         self.botao_substituir_excel.grid(row=0, column=1, padx=(5,0), pady=5, sticky="ew")
+        self.botao_exportar_excel = ctk.CTkButton(self.frame_salvar, text="Exportar Planilha", command=self.exportar_excel)
+        self.botao_exportar_excel.grid(row=1, column=0, columnspan=2, padx=0, pady=5, sticky="ew")
+
+        # Com a janela já na tela, prepara o cliente da API em segundo plano.
+        self.after(200, aquecer_em_segundo_plano)
         
     def _bloquear_botoes(self, processando=True):
         estado = "disabled" if processando else "normal"
         self.botao_carregar_arquivo.configure(state=estado)
         self.botao_carregar_pasta.configure(state=estado)
+        self.botao_vigiar_pasta.configure(state=estado)
         self.botao_adicionar_excel.configure(state=estado)
         self.botao_substituir_excel.configure(state=estado)
+        self.botao_exportar_excel.configure(state=estado)
         self.botao_adicionar.configure(state=estado)
         self.botao_limpar.configure(state=estado)
+        self.botao_limpar_cache.configure(state=estado)
         
     def iniciar_extracao_base(self, target_func, target_arg):
         if not target_arg: return
         self.label_status.configure(text=f"Processando '{os.path.basename(str(target_arg))}'...")
         self.progressbar.grid(row=0, column=1, padx=10, sticky="ew")
         self.progressbar.set(0)
+        self.botao_cancelar.configure(state="normal")
+        self.botao_cancelar.grid(row=0, column=2, padx=(0, 5))
         self._bloquear_botoes(True)
         self.textbox_analise.configure(state="normal"); self.textbox_analise.delete("1.0", "end"); self.textbox_analise.configure(state="disabled")
-        threading.Thread(target=target_func, args=(target_arg,), daemon=True).start()
+        # Fila e evento novos a cada extração, para que nada de uma execução anterior vaze para esta.
+        fila, self._cancelar_extracao = queue.Queue(), threading.Event()
+        self._andamento = {'total': 0, 'concluidas': 0, 'erros': 0, 'inicio': time.monotonic(), 'base': 0, 'vigia': False}
+        self._metricas = MetricasExecucao(guardar_imagens=bool(ARQUIVO_METRICAS))
+        self.label_metricas.configure(text="")
+        threading.Thread(target=self._executar_extracao, args=(target_func, target_arg, fila, self._cancelar_extracao, self._metricas), daemon=True).start()
+        self.after(INTERVALO_FILA_MS, self._drenar_fila_extracao, fila)
 
     def iniciar_extracao_arquivo(self):
-        caminho = filedialog.askopenfilename(title="Selecione um Arquivo de Imagem", filetypes=[("Arquivos de Imagem", "*.jpg *.jpeg *.png"), ("Todos os arquivos", "*.*")])
+        caminho = filedialog.askopenfilename(title="Selecione um Arquivo de Imagem", filetypes=[("Imagens e Documentos", "*.jpg *.jpeg *.png *.pdf *.tif *.tiff"), ("Todos os arquivos", "*.*")])
         self.iniciar_extracao_base(self._processar_arquivo_em_background, caminho)
 
     def iniciar_extracao_pasta(self):
         caminho = filedialog.askdirectory(title="Selecione a Pasta com as Imagens")
         self.iniciar_extracao_base(self._processar_pasta_em_background, caminho)
-        
-    def _processar_arquivo_em_background(self, caminho_arquivo):
-        self.progressbar.set(0.5)
-        novos_resultados = extrair_chaves_da_imagem(caminho_arquivo)
-        self.progressbar.set(1.0)
-        self.after(0, self.atualizar_interface_completa, novos_resultados, [caminho_arquivo])
-        
-    def _processar_pasta_em_background(self, caminho_pasta):
-        imagens = [f for f in os.listdir(caminho_pasta) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        total_imagens = len(imagens)
-        if total_imagens == 0: self.after(0, self.atualizar_interface_completa, [], []); return
-        
-        resultados_finais = []
-        for i, nome_img in enumerate(imagens):
-            caminho_completo = os.path.join(caminho_pasta, nome_img)
-            resultados_finais.extend(extrair_chaves_da_imagem(caminho_completo))
-            self.progressbar.set((i + 1) / total_imagens)
-        self.after(0, self.atualizar_interface_completa, resultados_finais, imagens)
-
-    def atualizar_interface_completa(self, novos_resultados, imagens_processadas):
-        self._sincronizar_painel_com_dados()
-        self.resultados_atuais.extend(novos_resultados)
-        self._redesenhar_painel_completo()
-        self.label_status.configure(text=f"{len(self.resultados_atuais)} chaves carregadas. {len(imagens_processadas)} imagens processadas.")
+
+    def iniciar_vigia_pasta(self):
+        caminho = filedialog.askdirectory(title="Selecione a Pasta a Vigiar")
+        if not caminho: return
+        self.iniciar_extracao_base(self._vigiar_pasta_em_background, caminho)
+        self._andamento['vigia'] = True
+        self.label_status.configure(text=f"Vigiando '{os.path.basename(caminho)}' e subpastas...")
+
+    def cancelar_extracao(self):
+        self._cancelar_extracao.set()
+        self.botao_cancelar.configure(state="disabled")
+        self.label_status.configure(text="Cancelando... aguardando as requisições já enviadas terminarem.")
+
+    def _executar_extracao(self, target_func, target_arg, fila, cancelar, metricas):
+        """Roda na thread de trabalho. Nunca toca nos widgets: tudo vai para a `fila`, que a interface consome."""
+        try:
+            target_func(target_arg, fila, cancelar, metricas)
+        finally:
+            fila.put(('fim', cancelar.is_set()))
+
+    def _extrair_para_fila(self, caminhos, fila, cancelar, metricas):
+        """Extrai as imagens enviando à fila o total e cada resultado (com o erro, se houver) assim que termina."""
+        fila.put(('total', len(caminhos)))
+        if not caminhos: return
+
+        def ao_concluir(indice, caminho, resultado, erro):
+            if erro is not None:
+                print(f"Erro na chamada da API Gemini para '{os.path.basename(caminho)}': {erro}")
+            fila.put(('imagem', resultado or [], erro))
+
+        extrair_chaves_de_varias_imagens(caminhos, ao_concluir=ao_concluir, cancelar=cancelar, metricas=metricas)
+
+    def _processar_arquivo_em_background(self, caminho_arquivo, fila, cancelar, metricas):
+        self._extrair_para_fila([caminho_arquivo], fila, cancelar, metricas)
+
+    def _processar_pasta_em_background(self, caminho_pasta, fila, cancelar, metricas):
+        imagens = sorted(f for f in os.listdir(caminho_pasta) if f.lower().endswith(EXTENSOES_ENTRADA))
+        self._extrair_para_fila([os.path.join(caminho_pasta, nome_img) for nome_img in imagens], fila, cancelar, metricas)
+
+    def _vigiar_pasta_em_background(self, caminho_pasta, fila, cancelar, metricas):
+        """Varre a pasta a cada `INTERVALO_VIGIA_S` até o cancelamento e envia só as imagens novas ou alteradas."""
+        # O SQLite só pode ser usado na thread que abriu a conexão, então o manifesto é aberto aqui.
+        manifesto = ManifestoProcessamento(os.path.join(os.getcwd(), ARQUIVO_MANIFESTO_VIGIA))
+        observador = ObservadorPasta(caminho_pasta, manifesto)
+        try:
+            while not cancelar.is_set():
+                novas = list(observador.varrer())
+                if novas:
+                    fila.put(('total', len(novas)))
+                    assinaturas = {caminho: (tamanho, mtime, hash_conteudo) for caminho, tamanho, mtime, hash_conteudo in novas}
+
+                    def ao_concluir(indice, caminho, resultado, erro):
+                        tamanho, mtime, hash_conteudo = assinaturas[caminho]
+                        if erro is not None:
+                            tentativas = manifesto.registrar_falha(caminho, tamanho, mtime, erro, hash_conteudo)
+                            print(f"Erro na chamada da API Gemini para '{os.path.basename(caminho)}' "
+                                  f"(tentativa {tentativas} de {MAX_TENTATIVAS_ARQUIVO}): {erro}")
+                        else:
+                            invalidas = sum(1 for r in resultado if not validar_formato_chave(r['Chave']))
+                            manifesto.marcar(caminho, tamanho, mtime, len(resultado), invalidas, hash_conteudo)
+                        observador.concluir(caminho)
+                        fila.put(('imagem', resultado or [], erro))
+
+                    extrair_chaves_de_varias_imagens(list(assinaturas), ao_concluir=ao_concluir, cancelar=cancelar, metricas=metricas)
+                cancelar.wait(INTERVALO_VIGIA_S)
+        finally:
+            manifesto.fechar()
+
+    def _drenar_fila_extracao(self, fila):
+        """Consome a fila na thread da interface, no máximo `MAX_MENSAGENS_POR_DRENAGEM` mensagens por vez.
+
+        As chaves de cada imagem são acrescentadas ao fim do painel assim que ela termina (na ordem de conclusão),
+        repreenchendo só as linhas visíveis novas.
+        """
+        andamento = self._andamento
+        inicio_novas = len(self.resultados_atuais)
+        cancelado = None
+        for _ in range(MAX_MENSAGENS_POR_DRENAGEM):
+            try:
+                mensagem = fila.get_nowait()
+            except queue.Empty:
+                break
+            if mensagem[0] == 'total':
+                if andamento['concluidas'] == andamento['total']:
+                    # Nova leva (modo vigia): a estimativa de tempo recomeça dela.
+                    andamento['inicio'], andamento['base'] = time.monotonic(), andamento['concluidas']
+                andamento['total'] += mensagem[1]
+            elif mensagem[0] == 'imagem':
+                _, linhas, erro = mensagem
+                andamento['concluidas'] += 1
+                if erro is not None:
+                    andamento['erros'] += 1
+                for linha in linhas:
+                    self.resultados_atuais.append(linha)
+                    self.indice_validacao.registrar(linha, len(self.resultados_atuais) - 1)
+            else:
+                cancelado = mensagem[1]
+                break
+
+        if len(self.resultados_atuais) > inicio_novas:
+            self.frame_rolavel.atualizar_a_partir_de(inicio_novas)
+            self._agendar_relatorio_validacao()
+        if cancelado is not None:
+            self._finalizar_extracao(cancelado)
+            return
+        self._mostrar_andamento()
+        # Se ainda sobrou mensagem, volta logo (deixando o Tk processar eventos no meio); senão espera o próximo ciclo.
+        self.after(1 if not fila.empty() else INTERVALO_FILA_MS, self._drenar_fila_extracao, fila)
+
+    def _mostrar_andamento(self):
+        andamento = self._andamento
+        if not andamento['total']: return
+        self.progressbar.set(andamento['concluidas'] / andamento['total'])
+        self.label_metricas.configure(text=self._metricas.resumo_curto())
+        if self._cancelar_extracao.is_set(): return
+        if andamento['vigia'] and andamento['concluidas'] == andamento['total']:
+            self.label_status.configure(text=f"Vigiando: {andamento['concluidas']} imagens processadas, {len(self.resultados_atuais)} chaves no painel. Aguardando novos arquivos...")
+            return
+        texto = f"Processando: {andamento['concluidas']}/{andamento['total']} imagens, {len(self.resultados_atuais)} chaves no painel"
+        feitas = andamento['concluidas'] - andamento['base']
+        if feitas:
+            decorrido = time.monotonic() - andamento['inicio']
+            restante = decorrido / feitas * (andamento['total'] - andamento['concluidas'])
+            texto += f" — faltam ~{formatar_duracao(restante)}"
+        self.label_status.configure(text=texto)
+
+    def _finalizar_extracao(self, cancelado):
+        andamento = self._andamento
+        self._atualizar_relatorio_validacao()
+        texto = f"{len(self.resultados_atuais)} chaves carregadas. {andamento['concluidas']} imagens processadas."
+        if andamento['vigia']:
+            texto = f"Vigia encerrada. {texto}"
+        elif cancelado:
+            texto = f"Extração cancelada. {texto[:-1]} de {andamento['total']}."
+        if andamento['erros']:
+            texto += f" {andamento['erros']} com erro."
+        self.label_status.configure(text=texto)
+        self.label_metricas.configure(text=self._metricas.resumo_curto())
+        if ARQUIVO_METRICAS:
+            try:
+                self._metricas.exportar(ARQUIVO_METRICAS)
+            except OSError as e:
+                print(f"Aviso: não foi possível gravar as métricas em '{ARQUIVO_METRICAS}': {e}")
         self.progressbar.grid_forget()
+        self.botao_cancelar.grid_forget()
         self._bloquear_botoes(False)
 
-    def _sincronizar_painel_com_dados(self):
-        for widget_info in self.widgets_linhas:
-            idx = widget_info['index']
-            if idx < len(self.resultados_atuais):
-                valor_atual_entry = widget_info['entry'].get()
-                self.resultados_atuais[idx]['Chave'] = valor_atual_entry
-
     def _redesenhar_painel_completo(self):
-        for widget_info in self.widgets_linhas:
-            widget_info['frame'].destroy()
-        self.widgets_linhas.clear()
-        
-        for i, resultado in enumerate(self.resultados_atuais):
-            self._desenhar_linha_chave(i, resultado)
-        
+        self.frame_rolavel.atualizar()
         self._atualizar_relatorio_validacao()
 
+    def _agendar_relatorio_validacao(self, *args):
+        """Agrupa as atualizações do relatório: várias edições seguidas geram no máximo uma por quadro."""
+        if self._relatorio_agendado: return
+        self._relatorio_agendado = True
+        self.after(INTERVALO_RELATORIO_MS, self._atualizar_relatorio_validacao)
+
+    def _ao_editar_linha(self, index):
+        self.indice_validacao.atualizar(self.resultados_atuais[index])
+        self._agendar_relatorio_validacao()
+
     def _atualizar_relatorio_validacao(self):
-        self._sincronizar_painel_com_dados()
-        chaves_para_revisao = []
-        for i, res in enumerate(self.resultados_atuais):
-            if not validar_formato_chave(res.get('Chave', '')):
-                chaves_para_revisao.append((i + 1, res))
+        self._relatorio_agendado = False
+        chaves_para_revisao = self.indice_validacao.linhas_invalidas(self.resultados_atuais)
+        chaves_duplicadas = self.indice_validacao.grupos_duplicados(self.resultados_atuais)
 
         total_chaves = len(self.resultados_atuais)
         
@@ -239,143 +356,141 @@ class App(ctk.CTk):
         relatorio += f"Total de Chaves no Painel: {total_chaves}\n\n"
         if chaves_para_revisao:
             relatorio += f"🚨 {len(chaves_para_revisao)} CHAVE(S) COM FORMATO INVÁLIDO PARA REVISÃO:\n"
-            for linha_num, item in chaves_para_revisao:
-                relatorio += f"- Linha {linha_num}: '{item.get('Chave', '')}' (Imagem: {item.get('Imagem', 'N/A')})\n"
+            for linha_num, item in chaves_para_revisao[:LIMITE_LINHAS_RELATORIO]:
+                sugestao = self.indice_validacao.sugestao(item)
+                sugestao = f" → sugestão: '{sugestao}'" if sugestao else ""
+                relatorio += f"- Linha {linha_num + 1}: '{item.get('Chave', '')}' (Imagem: {item.get('Imagem', 'N/A')}){sugestao}\n"
+            if len(chaves_para_revisao) > LIMITE_LINHAS_RELATORIO:
+                relatorio += f"... e mais {len(chaves_para_revisao) - LIMITE_LINHAS_RELATORIO}.\n"
         else:
             relatorio += "✅ Formato Válido: Todas as chaves no painel seguem o padrão correto."
-        
+        if chaves_duplicadas:
+            relatorio += f"\n⚠️ {len(chaves_duplicadas)} CHAVE(S) REPETIDA(S):\n"
+            for chave, posicoes in chaves_duplicadas[:LIMITE_LINHAS_RELATORIO]:
+                relatorio += f"- '{chave}' nas linhas {', '.join(str(p + 1) for p in posicoes)}\n"
+            if len(chaves_duplicadas) > LIMITE_LINHAS_RELATORIO:
+                relatorio += f"... e mais {len(chaves_duplicadas) - LIMITE_LINHAS_RELATORIO}.\n"
+
+        if relatorio == self._ultimo_relatorio: return
+        self._ultimo_relatorio = relatorio
         self.textbox_analise.configure(state="normal")
         self.textbox_analise.delete("1.0", "end")
         self.textbox_analise.insert("1.0", relatorio)
         self.textbox_analise.configure(state="disabled")
 
-    def _desenhar_linha_chave(self, index, dados_linha):
-        imagem = dados_linha.get('Imagem', 'MANUAL')
-        chave = dados_linha.get('Chave', '')
-
-        frame_linha = ctk.CTkFrame(self.frame_rolavel, fg_color=("gray85", "gray20"))
-        frame_linha.pack(fill="x", expand=True, padx=5, pady=2)
-        
-        def on_enter(e): frame_linha.configure(fg_color=("gray80", "gray25"))
-        def on_leave(e): frame_linha.configure(fg_color=("gray85", "gray20"))
-        frame_linha.bind("<Enter>", on_enter)
-        frame_linha.bind("<Leave>", on_leave)
-
-        label_numero_linha = ctk.CTkLabel(frame_linha, text=f"{index + 1}.", width=30, text_color="gray", font=self.main_font)
-        label_numero_linha.pack(side="left", padx=(10, 5), pady=5)
-
-        formato_valido = validar_formato_chave(chave)
-        cor_diagnostico = "light green" if formato_valido else "orange"
-        texto_diagnostico = "✅ Padrão Correto" if formato_valido else "⚠️ Verificar Formato"
-
-        label_imagem = ctk.CTkLabel(frame_linha, text=imagem, width=120, anchor="w", font=self.main_font)
-        label_imagem.pack(side="left", padx=5, pady=5)
-        
-        string_var = StringVar()
-        string_var.set(chave)
-        
-        label_diagnostico = ctk.CTkLabel(frame_linha, text=texto_diagnostico, text_color=cor_diagnostico, width=150, anchor="w", font=self.status_font)
-        
-        def on_key_change(*args):
-            texto_atual = string_var.get()
-            string_var.set(texto_atual.upper())
-            formato_valido_agora = validar_formato_chave(string_var.get())
-            if formato_valido_agora:
-                label_diagnostico.configure(text="✅ Padrão Correto", text_color="light green")
-            else:
-                label_diagnostico.configure(text="⚠️ Verificar Formato", text_color="orange")
-            self.after(50, self._atualizar_relatorio_validacao)
-
-        string_var.trace("w", on_key_change)
-        
-        entry_chave = ctk.CTkEntry(frame_linha, textvariable=string_var, font=self.main_font)
-        entry_chave.pack(side="left", fill="x", expand=True, padx=5, pady=5)
-        
-        label_diagnostico.pack(side="left", padx=5, pady=5)
-        
-        frame_acoes = ctk.CTkFrame(frame_linha, fg_color="transparent")
-        frame_acoes.pack(side="left", padx=5, pady=5)
-        
-        botao_subir = ctk.CTkButton(frame_acoes, text="↑", width=30, command=lambda idx=index: self.mover_linha(idx, -1))
-        botao_subir.pack(side="left", padx=(0,2))
-        botao_descer = ctk.CTkButton(frame_acoes, text="↓", width=30, command=lambda idx=index: self.mover_linha(idx, 1))
-        botao_descer.pack(side="left", padx=(0,5))
-        botao_excluir = ctk.CTkButton(frame_acoes, text="Excluir", width=60, fg_color="firebrick", hover_color="darkred", command=lambda idx=index: self.excluir_linha_chave(idx))
-        botao_excluir.pack(side="left")
-        
-        self.widgets_linhas.append({'frame': frame_linha, 'label': label_imagem, 'entry': entry_chave, 'index': index})
-
     def handle_adicionar_manual(self):
-        self._sincronizar_painel_com_dados()
         self.resultados_atuais.append({'Imagem': 'MANUAL', 'Chave': ''})
-        self._redesenhar_painel_completo()
+        novo_index = len(self.resultados_atuais) - 1
+        self.indice_validacao.registrar(self.resultados_atuais[novo_index], novo_index)
+        self.frame_rolavel.atualizar_a_partir_de(novo_index)
+        self.frame_rolavel.rolar_para(novo_index)
+        self._agendar_relatorio_validacao()
 
     def mover_linha(self, index_atual, direcao):
-        self._sincronizar_painel_com_dados()
         novo_index = index_atual + direcao
         if 0 <= novo_index < len(self.resultados_atuais):
             self.resultados_atuais[index_atual], self.resultados_atuais[novo_index] = self.resultados_atuais[novo_index], self.resultados_atuais[index_atual]
-            self._redesenhar_painel_completo()
+            self.indice_validacao.trocar_posicoes(self.resultados_atuais[index_atual], self.resultados_atuais[novo_index])
+            self.frame_rolavel.atualizar_indices(index_atual, novo_index)
+            self._agendar_relatorio_validacao()
 
     def excluir_linha_chave(self, index_para_remover):
-        self._sincronizar_painel_com_dados()
         if 0 <= index_para_remover < len(self.resultados_atuais):
-            self.resultados_atuais.pop(index_para_remover)
-            self._redesenhar_painel_completo()
+            self.indice_validacao.remover(self.resultados_atuais.pop(index_para_remover))
+            self.frame_rolavel.atualizar_a_partir_de(index_para_remover)
+            self._agendar_relatorio_validacao()
             
     def limpar_tudo(self):
         self.resultados_atuais.clear()
+        self.indice_validacao.limpar()
         self._redesenhar_painel_completo()
         self.label_status.configure(text="Painel limpo. Pronto para começar.")
 
+    def limpar_cache_ocr(self):
+        if not messagebox.askyesno("Limpar Cache", "Apagar todos os resultados guardados? As próximas extrações voltarão a consultar a API Gemini."):
+            return
+        removidas = obter_cache_ocr().invalidar()
+        self.label_status.configure(text=f"Cache de OCR limpo ({removidas} imagens removidas).")
+
     def _coletar_dados_do_painel(self):
-        self._sincronizar_painel_com_dados() 
-        
         if not self.resultados_atuais:
             messagebox.showwarning("Aviso", "Não há chaves no painel para salvar.")
             return None
         
-        for i, r in enumerate(self.resultados_atuais):
-            if not validar_formato_chave(r.get('Chave', '')):
-                messagebox.showerror("Erro de Validação", 
-                                     f"A chave na linha {i+1} não segue o formato padrão (XXXXX-XXXXX-XXXXX-XXXXX-XXXXX).\n\n"
-                                     "Por favor, corrija a chave ou exclua a linha antes de salvar.")
-                return None
+        chaves_para_revisao = self.indice_validacao.linhas_invalidas(self.resultados_atuais)
+        if chaves_para_revisao:
+            i = chaves_para_revisao[0][0]
+            messagebox.showerror("Erro de Validação", 
+                                 f"A chave na linha {i+1} não segue o formato padrão (XXXXX-XXXXX-XXXXX-XXXXX-XXXXX).\n\n"
+                                 "Por favor, corrija a chave ou exclua a linha antes de salvar.")
+            return None
             
-        dados_para_salvar = [{'Imagem': r['Imagem'], 'Chave': r['Chave']} for r in self.resultados_atuais]
-        return pd.DataFrame(dados_para_salvar)
+        return [{'Imagem': r['Imagem'], 'Chave': r['Chave']} for r in self.resultados_atuais]
+
+    def _obter_registro(self) -> RegistroChaves:
+        """Abre o registro de chaves; na primeira vez, importa a planilha existente para não perder o histórico."""
+        if self._registro is None:
+            registro = RegistroChaves(os.path.join(os.getcwd(), ARQUIVO_REGISTRO_CHAVES))
+            caminho_excel = os.path.join(os.getcwd(), NOME_ARQUIVO_EXCEL)
+            if registro.vazio() and os.path.exists(caminho_excel):
+                registro.importar_excel(caminho_excel)
+            self._registro = registro
+        return self._registro
 
     def substituir_em_excel(self):
-        df_novo = self._coletar_dados_do_painel();
-        if df_novo is None: return
+        dados_novos = self._coletar_dados_do_painel();
+        if dados_novos is None: return
         caminho_arquivo_final = os.path.join(os.getcwd(), NOME_ARQUIVO_EXCEL)
         try:
-            
-            df_novo.to_excel(caminho_arquivo_final, index=False, header=False)
+            registro = self._obter_registro()
+            registro.substituir(dados_novos)
+            registro.exportar_excel(caminho_arquivo_final)
             messagebox.showinfo("Sucesso", f"As chaves foram salvas, substituindo o arquivo anterior!\n\nO arquivo será aberto a seguir.")
             if os.path.exists(caminho_arquivo_final): os.startfile(caminho_arquivo_final)
         except Exception as e:
             messagebox.showerror("Erro", f"Ocorreu um erro ao salvar o arquivo:\n{e}")
 
     def adicionar_ao_excel(self):
-        df_novo = self._coletar_dados_do_painel()
-        if df_novo is None: return
+        dados_novos = self._coletar_dados_do_painel()
+        if dados_novos is None: return
+        try:
+            registro = self._obter_registro()
+            ineditas = registro.adicionar(dados_novos)
+            messagebox.showinfo("Sucesso", f"As chaves foram adicionadas ao registro! ({ineditas} novas)\n\n"
+                                           "Use \"Exportar Planilha\" para gerar o arquivo Excel.")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Ocorreu um erro ao salvar as chaves:\n{e}")
+
+    def exportar_excel(self):
         caminho_arquivo_final = os.path.join(os.getcwd(), NOME_ARQUIVO_EXCEL)
         try:
-            if os.path.exists(caminho_arquivo_final):
-                
-                df_antigo = pd.read_excel(caminho_arquivo_final, header=None, names=['Imagem', 'Chave'])
-                df_final = pd.concat([df_antigo, df_novo], ignore_index=True)
-                df_final.drop_duplicates(subset=['Chave'], keep='last', inplace=True)
-            else:
-                df_final = df_novo
-            
-            df_final.to_excel(caminho_arquivo_final, index=False, header=False)
-            messagebox.showinfo("Sucesso", f"As chaves foram adicionadas à planilha!\n\nO arquivo será aberto a seguir.")
+            total = self._obter_registro().exportar_excel(caminho_arquivo_final)
+            messagebox.showinfo("Sucesso", f"Planilha gerada com {total} chaves!\n\nO arquivo será aberto a seguir.")
             if os.path.exists(caminho_arquivo_final): os.startfile(caminho_arquivo_final)
         except Exception as e:
-            messagebox.showerror("Erro", f"Ocorreu um erro ao salvar o arquivo:\n{e}")
+            messagebox.showerror("Erro", f"Ocorreu um erro ao exportar a planilha:\n{e}")
+
+def perfil_inicializacao():
+    """Mede a importação e a abertura da janela, imprime o resultado em JSON e devolve 1 se passar do orçamento."""
+    importacao = time.perf_counter() - _INICIO_IMPORTACAO
+    inicio = time.perf_counter()
+    app = App()
+    app.update()
+    janela = time.perf_counter() - inicio
+    app.destroy()
+    carregados = [modulo for modulo in MODULOS_SOB_DEMANDA if modulo in sys.modules]
+    total_ms = round((importacao + janela) * 1000, 1)
+    print(json.dumps({'importacao_ms': round(importacao * 1000, 1), 'janela_ms': round(janela * 1000, 1),
+                      'total_ms': total_ms, 'orcamento_ms': ORCAMENTO_INICIALIZACAO_MS,
+                      'modulos_sob_demanda_carregados': carregados}, ensure_ascii=False))
+    if total_ms > ORCAMENTO_INICIALIZACAO_MS or carregados:
+        print(f"Inicialização fora do orçamento ({total_ms} ms de {ORCAMENTO_INICIALIZACAO_MS} ms; "
+              f"carregados antes da hora: {', '.join(carregados) or 'nenhum'}).", file=sys.stderr)
+        return 1
+    return 0
 
 if __name__ == "__main__":
+    if "--perfil-inicializacao" in sys.argv:
+        sys.exit(perfil_inicializacao())
     app = App()
     app.mainloop() 
@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+
+class IndiceValidacao:
+    """Índice incremental das linhas com formato inválido e das chaves repetidas no painel.
+
+    As linhas são identificadas pelo próprio dicionário de resultado (por `id`), então editar uma chave
+    custa O(1): só a linha alterada é revalidada. As posições (números de linha do relatório) são
+    mantidas num mapa que só é reconstruído depois de remoções.
+    A sugestão de correção de cada linha inválida (`sugerir`) é calculada uma vez e guardada até a chave mudar.
+    """
+
+    def __init__(self, validar, sugerir=None):
+        self.validar = validar
+        self.sugerir = sugerir
+        self.limpar()
+
+    def limpar(self):
+        self.linhas = {}
+        self.chave_da_linha = {}
+        self.linhas_por_chave = defaultdict(set)
+        self.invalidas = set()
+        self.duplicadas = set()
+        self.sugestoes = {}
+        self.posicoes = {}
+        self.posicoes_validas = True
+
+    def _indexar_chave(self, id_linha, chave):
+        self.chave_da_linha[id_linha] = chave
+        if self.validar(chave):
+            self.invalidas.discard(id_linha)
+        else:
+            self.invalidas.add(id_linha)
+        if chave:
+            ids = self.linhas_por_chave[chave]
+            ids.add(id_linha)
+            if len(ids) > 1:
+                self.duplicadas.add(chave)
+
+    def _desindexar_chave(self, id_linha):
+        chave = self.chave_da_linha.pop(id_linha, None)
+        self.invalidas.discard(id_linha)
+        self.sugestoes.pop(id_linha, None)
+        if chave:
+            ids = self.linhas_por_chave[chave]
+            ids.discard(id_linha)
+            if len(ids) < 2:
+                self.duplicadas.discard(chave)
+            if not ids:
+                del self.linhas_por_chave[chave]
+
+    def registrar(self, linha: dict, posicao: int = None):
+        """Adiciona uma linha ao índice. Informe `posicao` ao acrescentar no fim da lista para evitar reconstruir as posições."""
+        id_linha = id(linha)
+        self.linhas[id_linha] = linha
+        self._indexar_chave(id_linha, linha.get('Chave', ''))
+        if posicao is not None:
+            self.posicoes[id_linha] = posicao
+        else:
+            self.posicoes_validas = False
+
+    def remover(self, linha: dict):
+        id_linha = id(linha)
+        self.linhas.pop(id_linha, None)
+        self._desindexar_chave(id_linha)
+        self.posicoes.pop(id_linha, None)
+        self.posicoes_validas = False
+
+    def atualizar(self, linha: dict):
+        """Revalida uma única linha depois que sua chave mudou."""
+        id_linha = id(linha)
+        chave = linha.get('Chave', '')
+        if self.chave_da_linha.get(id_linha) == chave:
+            return
+        self._desindexar_chave(id_linha)
+        self._indexar_chave(id_linha, chave)
+
+    def trocar_posicoes(self, linha_a: dict, linha_b: dict):
+        """Atualiza as posições depois que duas linhas trocaram de lugar na lista."""
+        id_a, id_b = id(linha_a), id(linha_b)
+        self.posicoes[id_a], self.posicoes[id_b] = self.posicoes.get(id_b), self.posicoes.get(id_a)
+
+    def recarregar(self, resultados: list):
+        self.limpar()
+        for posicao, linha in enumerate(resultados):
+            self.registrar(linha, posicao)
+
+    def _posicao(self, id_linha, resultados):
+        if not self.posicoes_validas:
+            self.posicoes = {id(linha): posicao for posicao, linha in enumerate(resultados)}
+            self.posicoes_validas = True
+        return self.posicoes[id_linha]
+
+    def sugestao(self, linha: dict):
+        """A sugestão de correção para uma linha inválida (`None` se não houver), calculada só na primeira consulta."""
+        id_linha = id(linha)
+        if id_linha not in self.sugestoes:
+            sugestoes = self.sugerir(linha.get('Chave', ''), limite=1) if self.sugerir else []
+            self.sugestoes[id_linha] = sugestoes[0] if sugestoes else None
+        return self.sugestoes[id_linha]
+
+    def linhas_invalidas(self, resultados: list) -> list:
+        """Lista ordenada de (posição, linha) das chaves com formato inválido."""
+        return sorted((self._posicao(i, resultados), self.linhas[i]) for i in self.invalidas)
+
+    def grupos_duplicados(self, resultados: list) -> list:
+        """Lista ordenada de (chave, [posições]) para cada chave que aparece em mais de uma linha."""
+        grupos = [(chave, sorted(self._posicao(i, resultados) for i in self.linhas_por_chave[chave]))
+                  for chave in self.duplicadas]
+        return sorted(grupos, key=lambda grupo: grupo[1][0])
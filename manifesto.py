@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import time
+
+# Um arquivo que falha é tentado de novo após ESPERA_BASE_FALHA_S segundos, dobrando a cada falha (até
+# ESPERA_MAXIMA_FALHA_S), e deixado de lado depois de MAX_TENTATIVAS_ARQUIVO falhas, até que o arquivo mude.
+MAX_TENTATIVAS_ARQUIVO = int(os.getenv("MAX_TENTATIVAS_ARQUIVO", "5"))
+ESPERA_BASE_FALHA_S = float(os.getenv("ESPERA_BASE_FALHA_S", "60"))
+ESPERA_MAXIMA_FALHA_S = float(os.getenv("ESPERA_MAXIMA_FALHA_S", "3600"))
+
+
+class ManifestoProcessamento:
+    """Registro persistente (SQLite) das imagens já processadas, usado para retomar execuções interrompidas.
+
+    Uma imagem conta como processada enquanto o caminho, o tamanho e a data de modificação forem os mesmos
+    da execução em que foi registrada; se o arquivo mudar, ela volta a ser processada. O hash do conteúdo,
+    quando informado, permite reconhecer um arquivo só "tocado" (data nova, mesmo conteúdo).
+    As falhas ficam numa tabela à parte, com o número de tentativas da versão atual do arquivo (ver `pode_tentar`).
+    As consultas são feitas no disco, então a memória não cresce com o número de imagens.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._conexao = sqlite3.connect(caminho)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        with self._conexao:
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS imagens (
+                    caminho TEXT PRIMARY KEY,
+                    tamanho INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    chaves INTEGER NOT NULL,
+                    invalidas INTEGER NOT NULL,
+                    concluido_em REAL NOT NULL,
+                    hash TEXT
+                )
+            """)
+            colunas = {linha[1] for linha in self._conexao.execute("PRAGMA table_info(imagens)")}
+            if 'hash' not in colunas:
+                self._conexao.execute("ALTER TABLE imagens ADD COLUMN hash TEXT")
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS falhas (
+                    caminho TEXT PRIMARY KEY,
+                    tamanho INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    hash TEXT,
+                    tentativas INTEGER NOT NULL,
+                    proxima_em REAL NOT NULL,
+                    erro TEXT
+                )
+            """)
+
+    def ja_processada(self, caminho: str, tamanho: int, mtime: float) -> bool:
+        linha = self._conexao.execute("SELECT tamanho, mtime FROM imagens WHERE caminho = ?", (caminho,)).fetchone()
+        return linha is not None and linha[0] == tamanho and linha[1] == mtime
+
+    def marcar(self, caminho: str, tamanho: int, mtime: float, chaves: int, invalidas: int, hash_conteudo: str = None):
+        with self._conexao:
+            self._conexao.execute("INSERT OR REPLACE INTO imagens VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  (caminho, tamanho, mtime, chaves, invalidas, time.time(), hash_conteudo))
+            self._conexao.execute("DELETE FROM falhas WHERE caminho = ?", (caminho,))
+
+    def registrar_falha(self, caminho: str, tamanho: int, mtime: float, erro, hash_conteudo: str = None) -> int:
+        """Conta mais uma falha do arquivo e devolve quantas a versão atual já teve.
+
+        A contagem recomeça quando o arquivo muda (tamanho/data e hash diferentes dos da falha anterior).
+        """
+        linha = self._conexao.execute("SELECT tamanho, mtime, hash, tentativas FROM falhas WHERE caminho = ?",
+                                      (caminho,)).fetchone()
+        mesmo_arquivo = linha is not None and (
+            (linha[0], linha[1]) == (tamanho, mtime) or (hash_conteudo is not None and linha[2] == hash_conteudo))
+        tentativas = linha[3] + 1 if mesmo_arquivo else 1
+        espera = min(ESPERA_MAXIMA_FALHA_S, ESPERA_BASE_FALHA_S * (2 ** (tentativas - 1)))
+        with self._conexao:
+            self._conexao.execute("INSERT OR REPLACE INTO falhas VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  (caminho, tamanho, mtime, hash_conteudo, tentativas, time.time() + espera, str(erro)))
+        return tentativas
+
+    def pode_tentar(self, caminho: str, tamanho: int, mtime: float, respeitar_espera: bool = True) -> bool:
+        """Diz se um arquivo com falha registrada deve ser tentado de novo.
+
+        Sim se ele mudou desde a falha; senão, só abaixo de `MAX_TENTATIVAS_ARQUIVO` e (com `respeitar_espera`)
+        depois da espera da última falha.
+        """
+        linha = self._conexao.execute("SELECT tamanho, mtime, tentativas, proxima_em FROM falhas WHERE caminho = ?",
+                                      (caminho,)).fetchone()
+        if linha is None or (linha[0], linha[1]) != (tamanho, mtime):
+            return True
+        if linha[2] >= MAX_TENTATIVAS_ARQUIVO:
+            return False
+        return not respeitar_espera or time.time() >= linha[3]
+
+    def hash_processado(self, caminho: str):
+        """Hash do conteúdo registrado para o caminho (`None` se não houver)."""
+        linha = self._conexao.execute("SELECT hash FROM imagens WHERE caminho = ?", (caminho,)).fetchone()
+        return linha[0] if linha else None
+
+    def atualizar_assinatura(self, caminho: str, tamanho: int, mtime: float):
+        """Aceita o novo tamanho/data de um arquivo cujo conteúdo não mudou, sem reprocessá-lo."""
+        with self._conexao:
+            self._conexao.execute("UPDATE imagens SET tamanho = ?, mtime = ? WHERE caminho = ?", (tamanho, mtime, caminho))
+
+    def totais(self) -> dict:
+        imagens, chaves, invalidas = self._conexao.execute(
+            "SELECT COUNT(*), COALESCE(SUM(chaves), 0), COALESCE(SUM(invalidas), 0) FROM imagens").fetchone()
+        desistidas, = self._conexao.execute("SELECT COUNT(*) FROM falhas WHERE tentativas >= ?",
+                                            (MAX_TENTATIVAS_ARQUIVO,)).fetchone()
+        return {'imagens': imagens, 'chaves': chaves, 'invalidas': invalidas, 'desistidas': desistidas}
+
+    def limpar(self):
+        with self._conexao:
+            self._conexao.execute("DELETE FROM imagens")
+            self._conexao.execute("DELETE FROM falhas")
+
+    def fechar(self):
+        self._conexao.close()
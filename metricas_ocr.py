@@ -0,0 +1,252 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from agendador import categorizar_erro
+
+
+ETAPAS = ('leitura', 'decodificacao', 'preprocessamento', 'api', 'interpretacao')
+QUANTIS = (0.5, 0.9, 0.99)
+# Valores guardados por etapa para os percentis; acima disso, uma amostra uniforme (a memória não cresce com a execução).
+TAMANHO_AMOSTRA = int(os.getenv("TAMANHO_AMOSTRA_METRICAS", "10000"))
+# Medições individuais mantidas para a exportação em JSON (as mais recentes), quando pedidas.
+MAX_IMAGENS_METRICAS = int(os.getenv("MAX_IMAGENS_METRICAS", "10000"))
+
+
+def _percentil(ordenados: list, quantil: float) -> float:
+    """Percentil pelo método do posto mais próximo (`ordenados` já em ordem crescente)."""
+    if not ordenados:
+        return 0.0
+    posicao = max(0, min(len(ordenados) - 1, math.ceil(quantil * len(ordenados)) - 1))
+    return ordenados[posicao]
+
+
+class AmostraLimitada:
+    """Contagem, soma e máximo exatos de uma série, e uma amostra de reservatório de até `tamanho` valores.
+
+    Com até `tamanho` valores, os percentis são exatos; depois, estimados pela amostra.
+    """
+
+    def __init__(self, tamanho: int = TAMANHO_AMOSTRA):
+        self.tamanho = tamanho
+        self.contagem = 0
+        self.total = 0.0
+        self.maximo = 0.0
+        self.valores = []
+
+    def adicionar(self, valor: float):
+        self.contagem += 1
+        self.total += valor
+        self.maximo = max(self.maximo, valor)
+        if len(self.valores) < self.tamanho:
+            self.valores.append(valor)
+        else:
+            posicao = random.randrange(self.contagem)
+            if posicao < self.tamanho:
+                self.valores[posicao] = valor
+
+    def estatisticas(self) -> dict:
+        ordenados = sorted(self.valores)
+        dados = {'contagem': self.contagem, 'total_s': round(self.total, 6)}
+        for quantil in QUANTIS:
+            dados[f"p{round(quantil * 100)}_ms"] = round(_percentil(ordenados, quantil) * 1000, 3)
+        dados['max_ms'] = round(self.maximo * 1000, 3)
+        return dados
+
+
+class MedicaoImagem:
+    """Tempos por etapa, tokens e resultado de uma imagem. As etapas repetidas (novas tentativas) se somam."""
+
+    def __init__(self, caminho: str):
+        self.imagem = os.path.basename(caminho)
+        self.inicio = time.perf_counter()
+        self.duracao = None
+        self.etapas = {}
+        self.origem = None
+        self.tentativas = 0
+        self.tokens_prompt = 0
+        self.tokens_resposta = 0
+        self.chaves = 0
+        self.erro = None
+        self.categoria_erro = None
+
+    @contextmanager
+    def etapa(self, nome: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + time.perf_counter() - inicio
+
+    def somar(self, nome: str, segundos: float):
+        self.etapas[nome] = self.etapas.get(nome, 0.0) + segundos
+
+    def registrar_uso(self, resposta, divisor: int = 1):
+        """Soma os tokens de `usage_metadata` da resposta (divididos entre as imagens de um lote)."""
+        uso = getattr(resposta, 'usage_metadata', None)
+        if uso is None:
+            return
+        self.tokens_prompt += (getattr(uso, 'prompt_token_count', 0) or 0) // divisor
+        self.tokens_resposta += (getattr(uso, 'candidates_token_count', 0) or 0) // divisor
+
+    def como_dicionario(self) -> dict:
+        return {'imagem': self.imagem, 'origem': self.origem, 'tentativas': self.tentativas,
+                'duracao_s': round(self.duracao or 0.0, 6),
+                'etapas_s': {nome: round(valor, 6) for nome, valor in self.etapas.items()},
+                'tokens_prompt': self.tokens_prompt, 'tokens_resposta': self.tokens_resposta,
+                'chaves': self.chaves, 'erro': self.erro, 'categoria_erro': self.categoria_erro}
+
+
+class MetricasExecucao:
+    """Coleta as medições de todas as imagens de uma execução (seguro entre threads) e gera o resumo e as exportações.
+
+    Cada medição concluída entra só nos agregados por etapa (`AmostraLimitada`), então a memória fica constante
+    mesmo no modo vigia. Com `guardar_imagens`, as últimas `MAX_IMAGENS_METRICAS` medições ficam para o JSON.
+    """
+
+    def __init__(self, guardar_imagens: bool = False):
+        self.inicio = time.perf_counter()
+        self.fim = None
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self._concluidas = 0
+        self._duracoes = AmostraLimitada()
+        self._etapas = {}
+        self._imagens = deque(maxlen=MAX_IMAGENS_METRICAS if guardar_imagens else 0)
+        self._erros = {}
+        self._do_cache = 0
+        self._tokens = [0, 0]
+
+    def medicao(self, caminho: str) -> MedicaoImagem:
+        """A medição da imagem, criada no primeiro acesso (quando o trabalho nela começa)."""
+        with self._lock:
+            medicao = self._em_andamento.get(caminho)
+            if medicao is None:
+                medicao = self._em_andamento[caminho] = MedicaoImagem(caminho)
+            return medicao
+
+    def concluir(self, caminho: str, erro: Exception = None, chaves: int = 0):
+        medicao = self.medicao(caminho)
+        with self._lock:
+            self._em_andamento.pop(caminho, None)
+            medicao.duracao = time.perf_counter() - medicao.inicio
+            medicao.chaves = chaves
+            if erro is not None:
+                medicao.erro = str(erro)
+                medicao.categoria_erro = categorizar_erro(erro)
+                self._erros[medicao.categoria_erro] = self._erros.get(medicao.categoria_erro, 0) + 1
+            if medicao.origem == 'cache':
+                self._do_cache += 1
+            self._tokens[0] += medicao.tokens_prompt
+            self._tokens[1] += medicao.tokens_resposta
+            self._concluidas += 1
+            self._duracoes.adicionar(medicao.duracao)
+            for nome, segundos in medicao.etapas.items():
+                self._etapas.setdefault(nome, AmostraLimitada()).adicionar(segundos)
+            self._imagens.append(medicao)
+            self.fim = time.perf_counter()
+
+    def envolver_ao_concluir(self, ao_concluir=None):
+        """Devolve um `ao_concluir(indice, caminho, resultado, erro)` que registra a conclusão antes de chamar o original."""
+        def registrar(indice, caminho, resultado, erro):
+            self.concluir(caminho, erro, len(resultado or ()))
+            if ao_concluir:
+                ao_concluir(indice, caminho, resultado, erro)
+        return registrar
+
+    def _vazao(self, concluidas: int) -> float:
+        decorrido = (self.fim or time.perf_counter()) - self.inicio
+        return concluidas / decorrido if decorrido > 0 else 0.0
+
+    def resumo_curto(self) -> str:
+        """Uma linha para a barra de status, ex.: '3.2 img/s · 12 do cache · 2 erros (cota: 1, rede: 1)'."""
+        with self._lock:
+            concluidas = self._concluidas
+            erros = dict(self._erros)
+            do_cache = self._do_cache
+            tokens = sum(self._tokens)
+        if not concluidas:
+            return ""
+        texto = f"{self._vazao(concluidas):.1f} img/s"
+        if do_cache:
+            texto += f" · {do_cache} do cache"
+        if tokens:
+            texto += f" · {tokens / 1000:.1f}k tokens"
+        total_erros = sum(erros.values())
+        if total_erros:
+            detalhes = ', '.join(f"{categoria}: {n}" for categoria, n in sorted(erros.items()))
+            texto += f" · {total_erros} erro{'s' if total_erros > 1 else ''} ({detalhes})"
+        else:
+            texto += " · sem erros"
+        return texto
+
+    def resumo(self) -> dict:
+        """Totais da execução e percentis (em ms) de cada etapa e da duração total por imagem."""
+        with self._lock:
+            concluidas = self._concluidas
+            erros = dict(self._erros)
+            do_cache = self._do_cache
+            tokens_prompt, tokens_resposta = self._tokens
+            duracoes = self._duracoes.estatisticas()
+            etapas = {nome: amostra.estatisticas() for nome, amostra in self._etapas.items()}
+
+        nomes_etapas = [n for n in ETAPAS if n in etapas] + sorted(set(etapas) - set(ETAPAS))
+        return {
+            'imagens': concluidas,
+            'imagens_com_erro': sum(erros.values()),
+            'do_cache': do_cache,
+            'duracao_s': round((self.fim or time.perf_counter()) - self.inicio, 3),
+            'imagens_por_segundo': round(self._vazao(concluidas), 3),
+            'erros': erros,
+            'tokens': {'prompt': tokens_prompt, 'resposta': tokens_resposta},
+            'duracao_por_imagem': duracoes,
+            'etapas': {nome: etapas[nome] for nome in nomes_etapas},
+        }
+
+    def exportar(self, caminho: str):
+        """Grava em JSON ou, se a extensão for `.prom`, no formato textfile do Prometheus (troca atômica do arquivo)."""
+        if caminho.lower().endswith('.prom'):
+            conteudo = self._formatar_prometheus()
+        else:
+            with self._lock:
+                imagens = [m.como_dicionario() for m in self._imagens]
+            conteudo = json.dumps({'resumo': self.resumo(), 'imagens': imagens}, ensure_ascii=False, indent=2)
+        temporario = caminho + ".tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            f.write(conteudo + '\n')
+        os.replace(temporario, caminho)
+
+    def _formatar_prometheus(self) -> str:
+        resumo = self.resumo()
+        linhas = []
+
+        def metrica(nome, tipo, ajuda, amostras):
+            linhas.append(f"# HELP ocr_chaves_{nome} {ajuda}")
+            linhas.append(f"# TYPE ocr_chaves_{nome} {tipo}")
+            for rotulos, valor in amostras:
+                texto_rotulos = ','.join(f'{k}="{v}"' for k, v in rotulos.items())
+                linhas.append(f"ocr_chaves_{nome}{{{texto_rotulos}}} {valor}" if rotulos else f"ocr_chaves_{nome} {valor}")
+
+        metrica('imagens', 'gauge', "Imagens concluídas na execução.", [({}, resumo['imagens'])])
+        metrica('imagens_do_cache', 'gauge', "Imagens respondidas pelo cache.", [({}, resumo['do_cache'])])
+        metrica('imagens_por_segundo', 'gauge', "Vazão média da execução.", [({}, resumo['imagens_por_segundo'])])
+        metrica('erros', 'gauge', "Imagens com erro, por categoria.",
+                [({'categoria': categoria}, n) for categoria, n in sorted(resumo['erros'].items())])
+        metrica('tokens', 'gauge', "Tokens informados pela API.",
+                [({'tipo': tipo}, n) for tipo, n in resumo['tokens'].items()])
+
+        amostras = []
+        for nome, dados in [('total', resumo['duracao_por_imagem'])] + list(resumo['etapas'].items()):
+            for quantil in QUANTIS:
+                amostras.append(({'etapa': nome, 'quantile': quantil}, round(dados[f"p{round(quantil * 100)}_ms"] / 1000, 6)))
+        metrica('etapa_segundos', 'summary', "Duração por imagem de cada etapa (leitura, decodificação, pré-processamento, API, interpretação).",
+                amostras)
+        for nome, dados in [('total', resumo['duracao_por_imagem'])] + list(resumo['etapas'].items()):
+            linhas.append(f'ocr_chaves_etapa_segundos_sum{{etapa="{nome}"}} {dados["total_s"]}')
+            linhas.append(f'ocr_chaves_etapa_segundos_count{{etapa="{nome}"}} {dados["contagem"]}')
+        return '\n'.join(linhas)
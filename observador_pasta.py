@@ -0,0 +1,100 @@
+import hashlib
+import os
+import time
+
+from entrada_documentos import EXTENSOES_ENTRADA
+
+
+def hash_arquivo(caminho: str, tamanho_bloco: int = 1024 * 1024) -> str:
+    """SHA-256 do arquivo lido em blocos (o mesmo valor de `cache_ocr.hash_conteudo` sobre os bytes inteiros)."""
+    soma = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            soma.update(bloco)
+    return soma.hexdigest()
+
+
+class ObservadorPasta:
+    """Varre uma pasta (com subpastas) a cada chamada de `varrer` e entrega só o trabalho novo.
+
+    Um arquivo é novo quando caminho, tamanho ou data de modificação diferem do manifesto. Antes de ser entregue
+    ele precisa aparecer igual (mesmo tamanho e data) em duas varreduras separadas por pelo menos `espera_estavel`
+    segundos, e não pode estar vazio nem bloqueado; assim, arquivos que ainda estão sendo copiados ficam para depois.
+    Se só a data mudou e o hash do conteúdo é o já registrado, o manifesto é atualizado sem reprocessar.
+    Um arquivo com falha registrada no manifesto só volta depois da espera dela, ou antes se ele mudar, e deixa de
+    voltar quando as tentativas se esgotam (`ManifestoProcessamento.pode_tentar`).
+    Os arquivos já confirmados ficam num dicionário, então as varreduras seguintes custam um `stat` por arquivo.
+    """
+
+    def __init__(self, pasta: str, manifesto, extensoes=EXTENSOES_ENTRADA, espera_estavel: float = 2.0):
+        self.pasta = pasta
+        self.manifesto = manifesto
+        self.extensoes = tuple(extensoes)
+        self.espera_estavel = espera_estavel
+        self._conhecidos = {}
+        self._candidatos = {}
+        self._entregues = set()
+
+    def _listar(self):
+        pastas = [self.pasta]
+        while pastas:
+            atual = pastas.pop()
+            try:
+                with os.scandir(atual) as entradas:
+                    for entrada in entradas:
+                        try:
+                            if entrada.is_dir(follow_symlinks=False):
+                                pastas.append(entrada.path)
+                            elif entrada.is_file() and entrada.name.lower().endswith(self.extensoes):
+                                yield entrada.path, entrada.stat()
+                        except OSError:
+                            continue
+            except OSError as e:
+                print(f"Aviso: não foi possível ler a pasta '{atual}': {e}")
+
+    def varrer(self):
+        """Gera (caminho, tamanho, mtime, hash) de cada arquivo novo ou alterado que já terminou de ser gravado.
+
+        Cada arquivo entregue só volta a ser considerado depois de `concluir(caminho)`.
+        """
+        agora = time.monotonic()
+        vistos = set()
+        for caminho, info in self._listar():
+            vistos.add(caminho)
+            assinatura = (info.st_size, info.st_mtime)
+            if caminho in self._entregues or self._conhecidos.get(caminho) == assinatura:
+                continue
+            if self.manifesto.ja_processada(caminho, *assinatura):
+                self._conhecidos[caminho] = assinatura
+                continue
+            if not self.manifesto.pode_tentar(caminho, *assinatura):
+                continue
+
+            candidato = self._candidatos.get(caminho)
+            if candidato is None or candidato[0] != assinatura:
+                self._candidatos[caminho] = (assinatura, agora)
+                continue
+            if agora - candidato[1] < self.espera_estavel or info.st_size == 0:
+                continue
+            try:
+                hash_conteudo = hash_arquivo(caminho)
+            except OSError:
+                continue  # ainda bloqueado por quem está gravando
+            del self._candidatos[caminho]
+
+            if self.manifesto.hash_processado(caminho) == hash_conteudo:
+                self.manifesto.atualizar_assinatura(caminho, *assinatura)
+                self._conhecidos[caminho] = assinatura
+                continue
+            self._conhecidos.pop(caminho, None)
+            self._entregues.add(caminho)
+            yield caminho, info.st_size, info.st_mtime, hash_conteudo
+
+        # Esquece os arquivos apagados ou movidos desde a última varredura.
+        for registro in (self._candidatos, self._conhecidos):
+            for caminho in [c for c in registro if c not in vistos]:
+                del registro[caminho]
+
+    def concluir(self, caminho: str):
+        """Libera um arquivo entregue, depois de marcado no manifesto como concluído ou com falha (`registrar_falha`)."""
+        self._entregues.discard(caminho)
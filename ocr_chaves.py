@@ -0,0 +1,397 @@
+import os
+import re
+import io
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+from agendador import AgendadorExtracao
+from cache_ocr import CacheOCR, hash_conteudo
+from preprocessamento import preparar_imagem, formatar_relatorio
+from decodificador_chaves import corrigir_chave, VERSAO_DECODIFICADOR
+from metricas_ocr import MedicaoImagem
+from entrada_documentos import separar_unidade, listar_unidades, ler_unidade, liberar_pagina_decodificada, JuncaoUnidades
+
+
+load_dotenv()
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+MAX_REQUISICOES_SIMULTANEAS = int(os.getenv("MAX_REQUISICOES_SIMULTANEAS", "4"))
+MAX_REQUISICOES_POR_MINUTO = int(os.getenv("MAX_REQUISICOES_POR_MINUTO", "60"))
+ARQUIVO_CACHE_OCR = os.getenv("ARQUIVO_CACHE_OCR", "cache_ocr.sqlite3")
+MAX_MB_CACHE_OCR = float(os.getenv("MAX_MB_CACHE_OCR", "64"))
+MODELO_GEMINI = 'gemini-2.5-flash'
+PREPROCESSAR_IMAGENS = os.getenv("PREPROCESSAR_IMAGENS", "1") == "1"
+LADO_MAXIMO_IMAGEM = int(os.getenv("LADO_MAXIMO_IMAGEM", "1600"))
+QUALIDADE_JPEG = int(os.getenv("QUALIDADE_JPEG", "85"))
+RECORTAR_ETIQUETA = os.getenv("RECORTAR_ETIQUETA", "0") == "1"
+TAMANHO_LOTE_IMAGENS = int(os.getenv("TAMANHO_LOTE_IMAGENS", "1"))
+BACKEND_OCR = os.getenv("BACKEND_OCR", "gemini")
+BACKEND_OCR_LOCAL = os.getenv("BACKEND_OCR_LOCAL", "tesseract")
+CONFIANCA_MINIMA_LOCAL = float(os.getenv("CONFIANCA_MINIMA_LOCAL", "0.85"))
+
+PROMPT_EXTRACAO = """
+        Sua tarefa é atuar como um especialista em OCR para transcrever chaves de produto do Windows a partir da imagem com a máxima precisão.
+
+        REGRAS E DIRETRIZES IMPORTANTES:
+        1.  **Formato Exato:** A chave DEVE seguir o formato `XXXXX-XXXXX-XXXXX-XXXXX-XXXXX`. São 5 blocos de 5 caracteres alfanuméricos cada.
+        2.  **Caracteres Válidos:** Chaves de produto do Windows usam apenas letras maiúsculas e números. Elas NUNCA contêm as seguintes letras: A, E, I, O, U, L, S, Z. Elas NUNCA contêm os seguintes números: 0, 1, 5.
+        3.  **Correção de Ambiguidade:** Preste atenção extra a caracteres que são visualmente semelhantes. Siga estas regras de substituição:
+            - Se vir um 'O', transcreva como 'Q'.
+            - Se vir um '0', transcreva como 'D' ou 'Q'.
+            - Se vir um '8', transcreva como 'B'.
+            - Se vir um '1', transcreva como 'T' ou 'J'.
+            - Se vir um '5', transcreva como 'G'.
+            - Se vir um 'S', transcreva como 'G'.
+            - Se vir um 'Z', transcreva como '2'.
+            - Se vir um 'I', transcreva como 'T' ou 'J'.
+        4.  **Saída Limpa:** Liste cada chave encontrada numa nova linha, começando com "CHAVE: ". Não inclua nenhum outro texto ou comentário.
+
+        Exemplo de saída esperada:
+        CHAVE: NCKM6-93VT7-D64WF-2X9VK-MG9TT
+        CHAVE: GR79F-V4NGQ-RBGQK-X4RVV-PWF9C
+        """
+PROMPT_EXTRACAO_LOTE = PROMPT_EXTRACAO + """
+        MODO LOTE (substitui a regra 4 e o exemplo acima):
+        Você receberá várias imagens, cada uma precedida por uma linha "IMAGEM n:".
+        Para cada chave encontrada escreva uma linha no formato "IMAGEM n | CHAVE: XXXXX-XXXXX-XXXXX-XXXXX-XXXXX", onde n é o número da imagem de onde ela veio.
+        Se uma imagem não tiver nenhuma chave, escreva "IMAGEM n | NENHUMA".
+        Toda imagem recebida deve aparecer na resposta. Não inclua nenhum outro texto ou comentário.
+
+        Exemplo de saída esperada:
+        IMAGEM 1 | CHAVE: NCKM6-93VT7-D64WF-2X9VK-MG9TT
+        IMAGEM 1 | CHAVE: GR79F-V4NGQ-RBGQK-X4RVV-PWF9C
+        IMAGEM 2 | NENHUMA
+        """
+PADRAO_LINHA_LOTE = re.compile(r'^IMAGEM\s+(\d+)\s*[|:\-]\s*(?:CHAVE:\s*(.+)|NENHUMA\b.*)$', re.IGNORECASE)
+# Muda sempre que o texto de um dos prompts (ou a leitura da resposta do lote) muda, invalidando o cache de
+# resultados antigos: as chaves guardadas podem ter vindo tanto de uma requisição individual quanto de um lote.
+VERSAO_PROMPT = hashlib.sha256('\n'.join((PROMPT_EXTRACAO, PROMPT_EXTRACAO_LOTE, PADRAO_LINHA_LOTE.pattern))
+                               .encode('utf-8')).hexdigest()[:12]
+# O que é enviado também depende do pré-processamento, então ele entra na chave do cache.
+# As chaves guardadas já passaram pelo decodificador, então a versão dele também entra.
+VERSAO_EXTRACAO = (f"{VERSAO_PROMPT}-pre{LADO_MAXIMO_IMAGEM}q{QUALIDADE_JPEG}r{int(RECORTAR_ETIQUETA)}"
+                   if PREPROCESSAR_IMAGENS else VERSAO_PROMPT) + f"-dec{VERSAO_DECODIFICADOR}"
+
+
+
+_cache_ocr = None
+_cache_ocr_lock = threading.Lock()
+
+def obter_cache_ocr() -> CacheOCR:
+    """Abre (uma única vez) o cache persistente de resultados de OCR."""
+    global _cache_ocr
+    with _cache_ocr_lock:
+        if _cache_ocr is None:
+            _cache_ocr = CacheOCR(os.path.join(os.getcwd(), ARQUIVO_CACHE_OCR), max_bytes=int(MAX_MB_CACHE_OCR * 1024 * 1024))
+        return _cache_ocr
+
+
+# `google.generativeai` leva mais de um segundo para importar; ele só é carregado por `obter_modelo_gemini`.
+genai = None
+_modelo_gemini = None
+_modelo_gemini_lock = threading.Lock()
+
+def obter_modelo_gemini():
+    """Devolve o cliente do modelo, criado (e configurado com a chave da API) uma única vez e reutilizado por todas as chamadas."""
+    global genai, _modelo_gemini
+    with _modelo_gemini_lock:
+        if _modelo_gemini is None:
+            if genai is None:
+                import google.generativeai as modulo_genai
+                genai = modulo_genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            _modelo_gemini = genai.GenerativeModel(MODELO_GEMINI)
+        return _modelo_gemini
+
+
+def aquecer_em_segundo_plano():
+    """Carrega as bibliotecas de extração e cria o cliente numa thread, para que a primeira extração não espere por isso."""
+    def aquecer():
+        try:
+            from PIL import Image  # noqa: F401
+            if BACKEND_OCR in ('gemini', 'cascata'):
+                obter_modelo_gemini()
+        except Exception as e:
+            print(f"Aviso: não foi possível preparar o cliente da API Gemini: {e}")
+    threading.Thread(target=aquecer, daemon=True).start()
+
+
+def validar_formato_chave(chave: str) -> bool:
+    """Verifica se a chave segue o padrão XXXXX-XXXXX-XXXXX-XXXXX-XXXXX."""
+    padrao = re.compile(r'^[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}$')
+    return bool(padrao.match(chave))
+
+
+def _ler_imagem(caminho_imagem: str):
+    """Lê o arquivo (ou a página/bloco, ver `entrada_documentos`) e devolve (nome, bytes, hash do conteúdo)."""
+    if separar_unidade(caminho_imagem) is not None:
+        dados_imagem = ler_unidade(caminho_imagem)
+    else:
+        with open(caminho_imagem, 'rb') as f:
+            dados_imagem = f.read()
+    return os.path.basename(caminho_imagem), dados_imagem, hash_conteudo(dados_imagem)
+
+
+def _parte_da_imagem(nome_arquivo: str, dados_imagem: bytes, medicao: MedicaoImagem):
+    """Monta a parte de imagem enviada ao `generate_content`, já pré-processada se configurado."""
+    if PREPROCESSAR_IMAGENS:
+        dados_envio, relatorio = preparar_imagem(dados_imagem, lado_maximo=LADO_MAXIMO_IMAGEM,
+                                                 qualidade=QUALIDADE_JPEG, recortar=RECORTAR_ETIQUETA)
+        medicao.somar('decodificacao', relatorio['tempo_decodificacao'])
+        medicao.somar('preprocessamento', relatorio['tempo_preprocessamento'])
+        print(f"Imagem '{nome_arquivo}' preparada: {formatar_relatorio(relatorio)}")
+        return {'mime_type': 'image/jpeg', 'data': dados_envio}
+    from PIL import Image
+    with medicao.etapa('decodificacao'):
+        img = Image.open(io.BytesIO(dados_imagem))
+        img.load()
+    return img
+
+
+def _medicao(caminho_imagem: str, metricas=None) -> MedicaoImagem:
+    """A medição da imagem na execução atual; sem `metricas`, uma medição avulsa que é descartada."""
+    medicao = metricas.medicao(caminho_imagem) if metricas is not None else MedicaoImagem(caminho_imagem)
+    medicao.tentativas += 1
+    return medicao
+
+
+def _extrair_chaves_da_imagem_sem_tratamento(caminho_imagem: str, metricas=None, aguardar_vaga=None) -> list:
+    """Igual a `extrair_chaves_da_imagem`, mas deixa os erros da API subirem (usado pelo agendador para repetir 429/5xx).
+
+    `aguardar_vaga` (do agendador) só é chamado se a imagem não estiver no cache, logo antes da requisição.
+    """
+    medicao = _medicao(caminho_imagem, metricas)
+    with medicao.etapa('leitura'):
+        nome_arquivo, dados_imagem, hash_imagem = _ler_imagem(caminho_imagem)
+    chaves = obter_cache_ocr().obter(hash_imagem, MODELO_GEMINI, VERSAO_EXTRACAO)
+    if chaves is not None:
+        medicao.origem = 'cache'
+        print(f"\nChaves de '{nome_arquivo}' encontradas no cache.")
+        return [{'Imagem': nome_arquivo, 'Chave': chave} for chave in chaves]
+    return _extrair_chaves_pela_api(nome_arquivo, dados_imagem, hash_imagem, medicao, aguardar_vaga)
+
+
+def _extrair_chaves_pela_api(nome_arquivo: str, dados_imagem: bytes, hash_imagem: str, medicao: MedicaoImagem,
+                             aguardar_vaga=None) -> list:
+    """Envia uma imagem já lida (e sem acerto no cache) à API e guarda as chaves no cache."""
+    print(f"\nExtraindo chaves de '{nome_arquivo}'...")
+    medicao.origem = 'api'
+    model = obter_modelo_gemini()
+    img = _parte_da_imagem(nome_arquivo, dados_imagem, medicao)
+    if aguardar_vaga is not None:
+        aguardar_vaga()
+    with medicao.etapa('api'):
+        response = model.generate_content([PROMPT_EXTRACAO, img])
+    medicao.registrar_uso(response)
+    print(f"Texto recebido com sucesso.")
+
+    with medicao.etapa('interpretacao'):
+        chaves = []
+        for linha in (response.text or '').strip().split('\n'):
+            if linha.upper().startswith("CHAVE:"):
+                chaves.append(corrigir_chave(linha[len("CHAVE:"):]))
+    obter_cache_ocr().guardar(hash_imagem, MODELO_GEMINI, VERSAO_EXTRACAO, chaves)
+    return [{'Imagem': nome_arquivo, 'Chave': chave} for chave in chaves]
+
+
+def _atribuir_resposta_lote(texto: str, quantidade: int):
+    """Separa a resposta do modo lote por imagem.
+
+    Devolve uma lista com as chaves de cada imagem (`None` para as imagens que a resposta não cobriu),
+    ou `None` se alguma linha de chave não puder ser atribuída a uma imagem do lote.
+    """
+    chaves_por_imagem = [None] * quantidade
+    for linha in texto.strip().split('\n'):
+        linha = linha.strip()
+        if not linha:
+            continue
+        correspondencia = PADRAO_LINHA_LOTE.match(linha)
+        if correspondencia is None:
+            if "CHAVE:" in linha.upper():
+                return None
+            continue
+        posicao = int(correspondencia.group(1)) - 1
+        if not 0 <= posicao < quantidade:
+            return None
+        if chaves_por_imagem[posicao] is None:
+            chaves_por_imagem[posicao] = []
+        if correspondencia.group(2):
+            chaves_por_imagem[posicao].append(corrigir_chave(correspondencia.group(2)))
+    return chaves_por_imagem
+
+
+def _extrair_chaves_do_lote_sem_tratamento(caminhos: list, metricas=None, aguardar_vaga=None) -> list:
+    """Envia várias imagens numa única requisição. Devolve, para cada imagem, a lista de linhas
+    {'Imagem', 'Chave'} ou `None` quando a resposta não permitiu atribuir as chaves àquela imagem.
+
+    O tempo da chamada e da interpretação conta para cada imagem do lote; os tokens são divididos entre elas.
+    """
+    cache = obter_cache_ocr()
+    resultados = [None] * len(caminhos)
+    pendentes = []
+    medicoes = []
+    for i, caminho in enumerate(caminhos):
+        medicao = _medicao(caminho, metricas)
+        with medicao.etapa('leitura'):
+            nome_arquivo, dados_imagem, hash_imagem = _ler_imagem(caminho)
+        chaves = cache.obter(hash_imagem, MODELO_GEMINI, VERSAO_EXTRACAO)
+        if chaves is not None:
+            medicao.origem = 'cache'
+            print(f"\nChaves de '{nome_arquivo}' encontradas no cache.")
+            resultados[i] = [{'Imagem': nome_arquivo, 'Chave': chave} for chave in chaves]
+        else:
+            pendentes.append((i, nome_arquivo, dados_imagem, hash_imagem))
+            medicoes.append(medicao)
+
+    if len(pendentes) == 1:
+        # Uma só imagem fora do cache: vai sozinha, reaproveitando a leitura e a consulta já feitas.
+        i, nome_arquivo, dados_imagem, hash_imagem = pendentes[0]
+        resultados[i] = _extrair_chaves_pela_api(nome_arquivo, dados_imagem, hash_imagem, medicoes[0], aguardar_vaga)
+    elif pendentes:
+        print(f"\nExtraindo chaves de {len(pendentes)} imagens numa única requisição...")
+        partes = [PROMPT_EXTRACAO_LOTE]
+        for numero, ((_, nome_arquivo, dados_imagem, _), medicao) in enumerate(zip(pendentes, medicoes), start=1):
+            medicao.origem = 'api_lote'
+            partes.append(f"IMAGEM {numero}:")
+            partes.append(_parte_da_imagem(nome_arquivo, dados_imagem, medicao))
+        model = obter_modelo_gemini()
+        if aguardar_vaga is not None:
+            aguardar_vaga()
+        inicio = time.perf_counter()
+        try:
+            response = model.generate_content(partes)
+        finally:
+            duracao_api = time.perf_counter() - inicio
+            for medicao in medicoes:
+                medicao.somar('api', duracao_api)
+        print(f"Texto recebido com sucesso.")
+
+        inicio = time.perf_counter()
+        chaves_por_imagem = _atribuir_resposta_lote(response.text or '', len(pendentes))
+        duracao_interpretacao = time.perf_counter() - inicio
+        for medicao in medicoes:
+            medicao.somar('interpretacao', duracao_interpretacao)
+            medicao.registrar_uso(response, divisor=len(medicoes))
+        if chaves_por_imagem is None:
+            print("Resposta do lote não pôde ser atribuída às imagens; elas serão enviadas uma a uma.")
+            return resultados
+        for (i, nome_arquivo, _, hash_imagem), chaves in zip(pendentes, chaves_por_imagem):
+            if chaves is None:
+                continue
+            cache.guardar(hash_imagem, MODELO_GEMINI, VERSAO_EXTRACAO, chaves)
+            resultados[i] = [{'Imagem': nome_arquivo, 'Chave': chave} for chave in chaves]
+    return resultados
+
+
+def _extrair_varias_com_gemini(caminhos: list, ao_concluir=None, cancelar=None, metricas=None) -> list:
+    """Extração de várias imagens pela API Gemini, com lotes (`TAMANHO_LOTE_IMAGENS` > 1) e limite de taxa.
+
+    As imagens que o lote não conseguir atribuir são reenviadas individualmente.
+    """
+    resultados = [None] * len(caminhos)
+    pendentes = list(range(len(caminhos)))
+
+    if TAMANHO_LOTE_IMAGENS > 1 and len(caminhos) > 1:
+        lotes = [pendentes[i:i + TAMANHO_LOTE_IMAGENS] for i in range(0, len(pendentes), TAMANHO_LOTE_IMAGENS)]
+        pendentes = []
+        def ao_concluir_lote(_, lote, resultado_lote, erro):
+            if erro is not None:
+                print(f"Erro no lote de {len(lote)} imagens: {erro}. Elas serão enviadas uma a uma.")
+            for posicao, indice in enumerate(lote):
+                resultado = resultado_lote[posicao] if resultado_lote else None
+                if resultado is None:
+                    pendentes.append(indice)
+                    continue
+                resultados[indice] = resultado
+                if ao_concluir:
+                    ao_concluir(indice, caminhos[indice], resultado, None)
+
+        agendador_lotes = AgendadorExtracao(
+            lambda lote, aguardar_vaga: _extrair_chaves_do_lote_sem_tratamento([caminhos[i] for i in lote], metricas, aguardar_vaga),
+            max_simultaneas=MAX_REQUISICOES_SIMULTANEAS, max_por_minuto=MAX_REQUISICOES_POR_MINUTO, vaga_pela_funcao=True)
+        agendador_lotes.executar(lotes, ao_concluir=ao_concluir_lote, cancelar=cancelar)
+        pendentes.sort()
+        if cancelar is not None and cancelar.is_set():
+            return [resultado or [] for resultado in resultados]
+
+    def ao_concluir_imagem(posicao, caminho, resultado, erro):
+        resultados[pendentes[posicao]] = resultado
+        if ao_concluir:
+            ao_concluir(pendentes[posicao], caminho, resultado, erro)
+
+    # As imagens do cache não gastam vaga do limite por minuto: ela é tomada só antes da requisição.
+    agendador = AgendadorExtracao(lambda caminho, aguardar_vaga: _extrair_chaves_da_imagem_sem_tratamento(caminho, metricas, aguardar_vaga),
+                                  max_simultaneas=MAX_REQUISICOES_SIMULTANEAS,
+                                  max_por_minuto=MAX_REQUISICOES_POR_MINUTO, vaga_pela_funcao=True)
+    agendador.executar([caminhos[i] for i in pendentes], ao_concluir=ao_concluir_imagem, cancelar=cancelar)
+    return [resultado or [] for resultado in resultados]
+
+
+def _criar_backend_configurado():
+    from backends_ocr import criar_backend
+    if BACKEND_OCR == 'cascata':
+        return criar_backend('cascata', local=BACKEND_OCR_LOCAL, confianca_minima=CONFIANCA_MINIMA_LOCAL)
+    return criar_backend(BACKEND_OCR)
+
+
+def _extrair_unidades(unidades: list, ao_concluir=None, cancelar=None, metricas=None):
+    if metricas is not None:
+        ao_concluir = metricas.envolver_ao_concluir(ao_concluir)
+
+    def ao_concluir_linhas(indice, caminho, resultado, erro):
+        if ao_concluir:
+            ao_concluir(indice, caminho, None if resultado is None else resultado.como_linhas(), erro)
+
+    _criar_backend_configurado().extrair_varias(unidades, ao_concluir_linhas, cancelar, metricas)
+
+
+def extrair_chaves_de_varias_imagens(caminhos: list, ao_concluir=None, cancelar=None, metricas=None) -> list:
+    """Extrai as chaves de várias imagens em paralelo e devolve uma lista de resultados por imagem, na ordem de `caminhos`.
+
+    Usa o backend de `BACKEND_OCR` ('gemini', 'cascata' ou outro registrado em `backends_ocr`).
+    PDFs, TIFFs de várias páginas e imagens enormes são divididos em páginas e blocos (`entrada_documentos`), lidos
+    só quando chega a vez de cada um; o resultado do arquivo junta os deles, sem as chaves repetidas pela sobreposição.
+    `ao_concluir(indice, caminho, resultado, erro)` é chamado uma vez por arquivo.
+    `cancelar` (um `threading.Event`) interrompe a extração; as imagens não concluídas ficam sem `ao_concluir`.
+    `metricas` (um `MetricasExecucao`) recebe os tempos por etapa, os tokens e o resultado de cada página ou bloco.
+    """
+    caminhos = list(caminhos)
+    juncao = JuncaoUnidades(caminhos, ao_concluir)
+    for indice, caminho in enumerate(caminhos):
+        try:
+            unidades = list(listar_unidades(caminho))
+        except Exception as e:
+            print(f"Erro ao abrir '{os.path.basename(caminho)}': {e}")
+            if metricas is not None:
+                metricas.concluir(caminho, e)
+            juncao.falhar(indice, e)
+            continue
+        juncao.adicionar(indice, unidades)
+    try:
+        _extrair_unidades(juncao.unidades, juncao.ao_concluir_unidade, cancelar, metricas)
+    finally:
+        liberar_pagina_decodificada()
+    return [resultado or [] for resultado in juncao.resultados]
+
+
+def extrair_chaves_da_imagem(caminho_imagem: str, metricas=None) -> list:
+    """Usa um prompt simplificado para extrair apenas as chaves da imagem.
+
+    Erros viram lista vazia; com `metricas`, ficam registrados com a categoria.
+    """
+    try:
+        if list(listar_unidades(caminho_imagem)) != [caminho_imagem]:
+            # PDF, TIFF de várias páginas ou imagem grande demais: as páginas/blocos seguem o caminho de várias imagens.
+            return extrair_chaves_de_varias_imagens([caminho_imagem], metricas=metricas)[0]
+        if BACKEND_OCR == 'gemini':
+            linhas = _extrair_chaves_da_imagem_sem_tratamento(caminho_imagem, metricas)
+        else:
+            linhas = _criar_backend_configurado().extrair(caminho_imagem, metricas).como_linhas()
+    except Exception as e:
+        print(f"Erro na chamada da API Gemini para '{os.path.basename(caminho_imagem)}': {e}")
+        if metricas is not None:
+            metricas.concluir(caminho_imagem, e)
+        return []
+    if metricas is not None:
+        metricas.concluir(caminho_imagem, None, len(linhas))
+    return linhas
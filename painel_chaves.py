@@ -0,0 +1,248 @@
+import math
+from tkinter import Menu, StringVar
+import customtkinter as ctk
+
+
+ALTURA_LINHA_PADRAO = 40
+
+
+class PainelChavesVirtual(ctk.CTkFrame):
+    """Lista de chaves virtualizada: só existem widgets para as linhas visíveis, e eles são reaproveitados ao rolar.
+
+    `dados` é a própria lista de resultados do App (dicionários com 'Imagem' e 'Chave'); as edições feitas
+    nos campos são gravadas diretamente nela. Depois de alterar a lista, chame `atualizar()` (mudança geral),
+    `atualizar_indices(...)` (linhas trocadas de lugar) ou `atualizar_a_partir_de(i)` (inserção/remoção),
+    que só repreenchem as linhas visíveis afetadas.
+    `sugerir(chave)`, se informado, devolve correções candidatas, oferecidas pelo botão 💡 da linha.
+    """
+
+    def __init__(self, master, dados: list, validar, ao_mover, ao_excluir, ao_editar=None, sugerir=None,
+                 label_text="", label_font=None, fonte=None, fonte_status=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.dados = dados
+        self.validar = validar
+        self.ao_mover = ao_mover
+        self.ao_excluir = ao_excluir
+        self.ao_editar = ao_editar
+        self.sugerir = sugerir
+        self.fonte = fonte
+        self.fonte_status = fonte_status
+
+        self.linhas = []
+        self.primeira = 0
+        self.capacidade = 0
+        self.visiveis_inteiras = 1
+        self.altura_linha = ALTURA_LINHA_PADRAO
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+        self.label_titulo = ctk.CTkLabel(self, text=label_text, font=label_font, corner_radius=self.cget("corner_radius"),
+                                         fg_color=ctk.ThemeManager.theme["CTkScrollableFrame"]["label_fg_color"])
+        self.label_titulo.grid(row=0, column=0, columnspan=2, sticky="nwe", padx=3, pady=3)
+
+        self.area_linhas = ctk.CTkFrame(self, fg_color="transparent")
+        self.area_linhas.grid(row=1, column=0, sticky="nsew", padx=(3, 0), pady=(0, 3))
+        self.area_linhas.grid_propagate(False)
+        self.area_linhas.grid_columnconfigure(0, weight=1)
+        self.barra = ctk.CTkScrollbar(self, command=self._ao_usar_barra)
+        self.barra.grid(row=1, column=1, sticky="ns", pady=(0, 3))
+
+        self.area_linhas.bind("<Configure>", self._ao_redimensionar)
+        topo = self.winfo_toplevel()
+        for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            topo.bind(evento, self._ao_rolar_roda, add="+")
+
+    # --- Criação e preenchimento das linhas reutilizáveis ---
+
+    def _criar_linha(self, posicao):
+        frame_linha = ctk.CTkFrame(self.area_linhas, fg_color=("gray85", "gray20"))
+        linha = {'frame': frame_linha, 'index': None, 'preenchendo': False}
+
+        def on_enter(e): frame_linha.configure(fg_color=("gray80", "gray25"))
+        def on_leave(e): frame_linha.configure(fg_color=("gray85", "gray20"))
+        frame_linha.bind("<Enter>", on_enter)
+        frame_linha.bind("<Leave>", on_leave)
+
+        linha['label_numero'] = ctk.CTkLabel(frame_linha, text="", width=30, text_color="gray", font=self.fonte)
+        linha['label_numero'].pack(side="left", padx=(10, 5), pady=5)
+        linha['label_imagem'] = ctk.CTkLabel(frame_linha, text="", width=120, anchor="w", font=self.fonte)
+        linha['label_imagem'].pack(side="left", padx=5, pady=5)
+
+        linha['var'] = StringVar()
+        linha['label_diagnostico'] = ctk.CTkLabel(frame_linha, text="", width=150, anchor="w", font=self.fonte_status)
+        linha['var'].trace_add("write", lambda *args: self._ao_digitar(linha))
+        linha['entry'] = ctk.CTkEntry(frame_linha, textvariable=linha['var'], font=self.fonte)
+        linha['entry'].pack(side="left", fill="x", expand=True, padx=5, pady=5)
+        linha['label_diagnostico'].pack(side="left", padx=5, pady=5)
+
+        frame_acoes = ctk.CTkFrame(frame_linha, fg_color="transparent")
+        frame_acoes.pack(side="left", padx=5, pady=5)
+        linha['frame_acoes'] = frame_acoes
+        linha['botao_sugestao'] = ctk.CTkButton(frame_linha, text="💡", width=30,
+                                                command=lambda: self._mostrar_sugestoes(linha))
+        ctk.CTkButton(frame_acoes, text="↑", width=30, command=lambda: self.ao_mover(linha['index'], -1)).pack(side="left", padx=(0, 2))
+        ctk.CTkButton(frame_acoes, text="↓", width=30, command=lambda: self.ao_mover(linha['index'], 1)).pack(side="left", padx=(0, 5))
+        ctk.CTkButton(frame_acoes, text="Excluir", width=60, fg_color="firebrick", hover_color="darkred",
+                      command=lambda: self.ao_excluir(linha['index'])).pack(side="left")
+
+        frame_linha.grid(row=posicao, column=0, sticky="ew", padx=5, pady=2)
+        frame_linha.grid_remove()
+        if posicao == 0:
+            frame_linha.bind("<Configure>", self._ao_medir_linha)
+        return linha
+
+    def _ao_medir_linha(self, event):
+        altura = max(event.height + 4, 10)
+        if altura != self.altura_linha:
+            self.altura_linha = altura
+            self._ao_redimensionar()
+
+    def _mostrar_diagnostico(self, linha, chave):
+        formato_valido = self.validar(chave)
+        sugestoes = tuple(self.sugerir(chave)) if self.sugerir else ()
+        estado = (formato_valido, sugestoes)
+        if estado != linha.get('valida'):
+            linha['valida'] = estado
+            linha['sugestoes'] = sugestoes
+            if formato_valido and not sugestoes:
+                linha['label_diagnostico'].configure(text="✅ Padrão Correto", text_color="light green")
+            elif formato_valido:
+                linha['label_diagnostico'].configure(text="💡 Caracteres Suspeitos", text_color="gold")
+            else:
+                linha['label_diagnostico'].configure(text="⚠️ Verificar Formato", text_color="orange")
+            if sugestoes:
+                linha['botao_sugestao'].pack(side="left", padx=(0, 5), pady=5, before=linha['frame_acoes'])
+            else:
+                linha['botao_sugestao'].pack_forget()
+
+    def _mostrar_sugestoes(self, linha):
+        """Abre um menu com as correções candidatas; escolher uma substitui o texto da linha."""
+        if linha['index'] is None or not linha.get('sugestoes'):
+            return
+        menu = Menu(self, tearoff=0)
+        for sugestao in linha['sugestoes']:
+            menu.add_command(label=sugestao, command=lambda s=sugestao: linha['var'].set(s))
+        botao = linha['botao_sugestao']
+        try:
+            menu.tk_popup(botao.winfo_rootx(), botao.winfo_rooty() + botao.winfo_height())
+        finally:
+            menu.grab_release()
+
+    def _preencher_linha(self, linha, indice):
+        dados_linha = self.dados[indice]
+        chave = dados_linha.get('Chave', '')
+        if linha['index'] != indice:
+            linha['index'] = indice
+            linha['label_numero'].configure(text=f"{indice + 1}.")
+        imagem = dados_linha.get('Imagem', 'MANUAL')
+        if linha.get('imagem') != imagem:
+            linha['imagem'] = imagem
+            linha['label_imagem'].configure(text=imagem)
+        if linha['var'].get() != chave:
+            linha['preenchendo'] = True
+            linha['var'].set(chave)
+            linha['preenchendo'] = False
+        self._mostrar_diagnostico(linha, chave)
+
+    def _ao_digitar(self, linha):
+        if linha['preenchendo'] or linha['index'] is None or linha['index'] >= len(self.dados):
+            return
+        texto_atual = linha['var'].get()
+        if texto_atual != texto_atual.upper():
+            linha['var'].set(texto_atual.upper())
+            return
+        self.dados[linha['index']]['Chave'] = texto_atual
+        self._mostrar_diagnostico(linha, texto_atual)
+        if self.ao_editar:
+            self.ao_editar(linha['index'])
+
+    # --- Janela visível ---
+
+    def _ao_redimensionar(self, event=None):
+        altura = self.area_linhas.winfo_height()
+        self.visiveis_inteiras = max(1, altura // self.altura_linha)
+        capacidade = max(1, math.ceil(altura / self.altura_linha))
+        while len(self.linhas) < capacidade:
+            self.linhas.append(self._criar_linha(len(self.linhas)))
+        self.capacidade = capacidade
+        self.atualizar()
+
+    def _limitar_primeira(self):
+        self.primeira = max(0, min(self.primeira, len(self.dados) - self.visiveis_inteiras))
+
+    def _atualizar_barra(self):
+        total = len(self.dados)
+        if total <= self.visiveis_inteiras:
+            self.barra.set(0.0, 1.0)
+        else:
+            self.barra.set(self.primeira / total, min(1.0, (self.primeira + self.visiveis_inteiras) / total))
+
+    def _repreencher(self, condicao=None):
+        total = len(self.dados)
+        for posicao, linha in enumerate(self.linhas):
+            indice = self.primeira + posicao
+            if posicao >= self.capacidade or indice >= total:
+                if linha['index'] is not None:
+                    linha['index'] = None
+                    linha['frame'].grid_remove()
+                continue
+            if linha['index'] is None:
+                linha['frame'].grid()
+                self._preencher_linha(linha, indice)
+            elif linha['index'] != indice or condicao is None or condicao(indice):
+                self._preencher_linha(linha, indice)
+
+    def atualizar(self):
+        """Repreenche todas as linhas visíveis (use após trocar ou estender a lista inteira)."""
+        self._limitar_primeira()
+        self._repreencher()
+        self._atualizar_barra()
+
+    def atualizar_indices(self, *indices):
+        """Repreenche apenas as linhas visíveis que mostram os índices informados."""
+        alvo = set(indices)
+        self._repreencher(lambda indice: indice in alvo)
+
+    def atualizar_a_partir_de(self, indice_inicial):
+        """Para inserções/remoções: repreenche as linhas visíveis a partir de `indice_inicial`."""
+        self._limitar_primeira()
+        self._repreencher(lambda indice: indice >= indice_inicial)
+        self._atualizar_barra()
+
+    def rolar_para(self, indice):
+        """Garante que a linha `indice` esteja visível."""
+        if indice < self.primeira:
+            self.primeira = indice
+        elif indice >= self.primeira + self.visiveis_inteiras:
+            self.primeira = indice - self.visiveis_inteiras + 1
+        else:
+            return
+        self.atualizar()
+
+    def rolar(self, linhas):
+        anterior = self.primeira
+        self.primeira += linhas
+        self._limitar_primeira()
+        if self.primeira != anterior:
+            self._repreencher(lambda indice: False)
+            self._atualizar_barra()
+
+    def _ao_usar_barra(self, acao, valor, unidade=None):
+        if acao == 'moveto':
+            self.primeira = int(round(float(valor) * len(self.dados)))
+            self._limitar_primeira()
+            self._repreencher(lambda indice: False)
+            self._atualizar_barra()
+        elif acao == 'scroll':
+            passo = self.visiveis_inteiras if unidade == 'pages' else 1
+            self.rolar(int(valor) * passo)
+
+    def _ao_rolar_roda(self, event):
+        widget = self.winfo_containing(event.x_root, event.y_root)
+        caminho = str(self.area_linhas)
+        if widget is None or not (str(widget) == caminho or str(widget).startswith(caminho + ".")):
+            return
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.rolar(-3)
+        else:
+            self.rolar(3)
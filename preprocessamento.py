@@ -0,0 +1,104 @@
+import io
+import time
+
+
+LADO_DETECCAO = 800
+
+
+def _detectar_regiao_texto(img):
+    """Localiza a região com texto (a etiqueta) e devolve a caixa (esq, topo, dir, base) nas coordenadas de `img`, ou `None`."""
+    from PIL import Image
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        print("Aviso: OpenCV/NumPy não instalados; recorte da etiqueta ignorado.")
+        return None
+
+    escala = min(1.0, LADO_DETECCAO / max(img.size))
+    pequena = img.convert('L')
+    if escala < 1.0:
+        pequena = pequena.resize((max(1, int(img.width * escala)), max(1, int(img.height * escala))), Image.BILINEAR)
+    cinza = np.asarray(pequena)
+    altura, largura = cinza.shape
+
+    # Bordas fortes e próximas (caracteres) viram blocos horizontais que cobrem as linhas de texto.
+    gradiente = cv2.morphologyEx(cinza, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, binaria = cv2.threshold(gradiente, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    nucleo = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, largura // 40), 3))
+    linhas = cv2.morphologyEx(binaria, cv2.MORPH_CLOSE, nucleo)
+    contornos, _ = cv2.findContours(linhas, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    caixas = []
+    for contorno in contornos:
+        x, y, w, h = cv2.boundingRect(contorno)
+        if w >= largura * 0.1 and h >= 4 and w > 2 * h:
+            caixas.append((x, y, x + w, y + h))
+    if not caixas:
+        return None
+
+    esq = min(c[0] for c in caixas); topo = min(c[1] for c in caixas)
+    dir_ = max(c[2] for c in caixas); base = max(c[3] for c in caixas)
+    margem_x = int((dir_ - esq) * 0.05) + 2
+    margem_y = int((base - topo) * 0.1) + 2
+    esq, topo = max(0, esq - margem_x), max(0, topo - margem_y)
+    dir_, base = min(largura, dir_ + margem_x), min(altura, base + margem_y)
+    if (dir_ - esq) * (base - topo) < 0.01 * largura * altura:
+        return None
+    return (int(esq / escala), int(topo / escala),
+            min(img.width, int(dir_ / escala)), min(img.height, int(base / escala)))
+
+
+def preparar_imagem(dados: bytes, lado_maximo: int = 1600, qualidade: int = 85,
+                    tons_de_cinza: bool = True, recortar: bool = False):
+    """Prepara a imagem para envio: corrige a orientação EXIF, converte para cinza, recorta a etiqueta
+    (opcional), reduz o maior lado para `lado_maximo` e recodifica como JPEG.
+
+    Devolve `(bytes_jpeg, relatorio)`, onde `relatorio` traz tamanhos e dimensões antes e depois e os tempos
+    de decodificação e de preparo, em segundos.
+    """
+    from PIL import Image, ImageOps  # importado só no primeiro uso, para não atrasar a abertura do programa
+
+    inicio = time.perf_counter()
+    img = Image.open(io.BytesIO(dados))
+    img.load()
+    dimensoes_originais = img.size
+    decodificada = time.perf_counter()
+    img = ImageOps.exif_transpose(img)
+    img = img.convert('L') if tons_de_cinza else img.convert('RGB')
+
+    recortada = False
+    if recortar:
+        caixa = _detectar_regiao_texto(img)
+        if caixa:
+            img = img.crop(caixa)
+            recortada = True
+
+    if lado_maximo and max(img.size) > lado_maximo:
+        img.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+
+    saida = io.BytesIO()
+    img.save(saida, format='JPEG', quality=qualidade, optimize=True)
+    dados_enviados = saida.getvalue()
+
+    relatorio = {
+        'tamanho_original': len(dados),
+        'tamanho_enviado': len(dados_enviados),
+        'dimensoes_originais': dimensoes_originais,
+        'dimensoes_enviadas': img.size,
+        'recortada': recortada,
+        'tempo_decodificacao': decodificada - inicio,
+        'tempo_preprocessamento': time.perf_counter() - decodificada,
+    }
+    return dados_enviados, relatorio
+
+
+def formatar_relatorio(relatorio: dict) -> str:
+    """Resumo de uma linha, ex.: '3.2 MB -> 180.4 KB (4000x3000 -> 1600x1200)'."""
+    def tamanho(n):
+        return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.1f} KB"
+    (lo, ao), (le, ae) = relatorio['dimensoes_originais'], relatorio['dimensoes_enviadas']
+    texto = f"{tamanho(relatorio['tamanho_original'])} -> {tamanho(relatorio['tamanho_enviado'])} ({lo}x{ao} -> {le}x{ae})"
+    if relatorio['recortada']:
+        texto += " [recortada]"
+    return texto
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import time
+from itertools import islice
+
+
+# Chaves consultadas por vez no `IN (...)` (abaixo do limite de parâmetros do SQLite).
+TAMANHO_BLOCO_CONSULTA = 500
+
+
+class RegistroChaves:
+    """Registro local (SQLite) de todas as chaves salvas, com índice único na chave.
+
+    Adicionar um lote custa O(tamanho do lote): chaves repetidas substituem a entrada antiga e passam para o
+    fim da ordem, o mesmo resultado do antigo `drop_duplicates(subset=['Chave'], keep='last')`.
+    A planilha `.xlsx` é gerada sob demanda por `exportar_excel`.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._conexao = sqlite3.connect(caminho)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        with self._conexao:
+            self._conexao.execute("""
+                CREATE TABLE IF NOT EXISTS chaves (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    imagem TEXT NOT NULL,
+                    chave TEXT NOT NULL UNIQUE,
+                    registrado_em REAL NOT NULL
+                )
+            """)
+
+    def __len__(self):
+        """Total de chaves (percorre a tabela inteira; fora do caminho de salvamento)."""
+        return self._conexao.execute("SELECT COUNT(*) FROM chaves").fetchone()[0]
+
+    def vazio(self) -> bool:
+        return self._conexao.execute("SELECT 1 FROM chaves LIMIT 1").fetchone() is None
+
+    def adicionar(self, linhas) -> int:
+        """Grava as linhas {'Imagem', 'Chave'}; uma chave já registrada é substituída pela nova. Devolve quantas eram inéditas.
+
+        As inéditas são contadas consultando só as chaves do lote no índice, então o custo não depende do total salvo.
+        """
+        with self._conexao:
+            return self._gravar(linhas)
+
+    def _gravar(self, linhas) -> int:
+        """Corpo de `adicionar`, sem abrir transação (quem chama usa `with self._conexao`)."""
+        agora = time.time()
+        ineditas = 0
+        linhas = iter(linhas)
+        while True:
+            bloco = list(islice(linhas, TAMANHO_BLOCO_CONSULTA))
+            if not bloco:
+                break
+            chaves = list({linha['Chave'] for linha in bloco})
+            existentes = self._conexao.execute(
+                f"SELECT COUNT(*) FROM chaves WHERE chave IN ({','.join('?' * len(chaves))})", chaves).fetchone()[0]
+            ineditas += len(chaves) - existentes
+            self._conexao.executemany(
+                "INSERT OR REPLACE INTO chaves (imagem, chave, registrado_em) VALUES (?, ?, ?)",
+                ((linha['Imagem'], linha['Chave'], agora) for linha in bloco))
+        return ineditas
+
+    def substituir(self, linhas: list):
+        """Apaga o registro e grava apenas as linhas informadas, numa só transação (se a gravação falhar, nada se perde)."""
+        with self._conexao:
+            self._conexao.execute("DELETE FROM chaves")
+            self._gravar(linhas)
+
+    def importar_excel(self, caminho_excel: str) -> int:
+        """Carrega uma planilha no formato antigo (duas colunas, sem cabeçalho) para o registro."""
+        from openpyxl import load_workbook
+        wb = load_workbook(caminho_excel, read_only=True)
+        try:
+            linhas = ({'Imagem': str(imagem), 'Chave': str(chave)}
+                      for imagem, chave, *_ in wb.active.iter_rows(values_only=True) if chave is not None)
+            return self.adicionar(linhas)
+        finally:
+            wb.close()
+
+    def exportar_excel(self, caminho_excel: str) -> int:
+        """Gera a planilha (Imagem, Chave; sem cabeçalho) em modo de escrita contínua. Devolve o número de linhas."""
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        total = 0
+        for imagem, chave in self._conexao.execute("SELECT imagem, chave FROM chaves ORDER BY id"):
+            ws.append([imagem, chave])
+            total += 1
+        temporario = caminho_excel + ".tmp"
+        wb.save(temporario)
+        os.replace(temporario, caminho_excel)
+        return total
+
+    def fechar(self):
+        self._conexao.close()